@@ -0,0 +1,272 @@
+"""
+Faux serveur ATAL pour les benchmarks : sert dans un thread, sur 127.0.0.1, un
+patrimoine, des lignes de location, des thématiques et des pièces jointes synthétiques
+de taille et de latence réglables.
+
+$top et $skip sont appliqués pour que la lecture par pages soit mesurée. Sur les lignes
+de location, $filter est appliqué pour le sous-ensemble d'OData qu'envoie le connecteur :
+comparaisons eq, gt, ge, lt, le sur Id, RoomId, StartDate et EndDate, combinées par and,
+or et des parenthèses. Les autres options OData ($select, $expand, $orderby) sont ignorées.
+"""
+import collections
+import datetime
+import json
+import operator
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+
+FILTER_OPERATORS = {
+    "eq": operator.eq,
+    "gt": operator.gt,
+    "ge": operator.ge,
+    "lt": operator.lt,
+    "le": operator.le,
+}
+
+
+def parse_filter_value(field, value):
+    if field in ("Id", "RoomId"):
+        return int(value)
+    if field in ("StartDate", "EndDate"):
+        # les dates du jeu de données sont des heures locales sans fuseau : le fuseau
+        # éventuel de la valeur est ignoré
+        return datetime.datetime.fromisoformat(value).replace(tzinfo=None)
+    raise ValueError(f"unsupported $filter field: {field}")
+
+
+def parse_filter(text):
+    """
+    :param text: $filter OData, ex. "(RoomId eq 2 or RoomId eq 3) and StartDate ge 2024-01-01"
+    :return: fonction qui dit si une ligne de location passe le filtre
+    """
+    tokens = re.findall(r"\(|\)|[^\s()]+", text)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take(expected=None):
+        nonlocal position
+        token = peek()
+        if token is None or (expected is not None and token != expected):
+            raise ValueError(f"invalid $filter: {text}")
+        position += 1
+        return token
+
+    def disjunction():
+        terms = [conjunction()]
+        while peek() == "or":
+            take()
+            terms.append(conjunction())
+        return lambda line: any(term(line) for term in terms)
+
+    def conjunction():
+        factors = [comparison()]
+        while peek() == "and":
+            take()
+            factors.append(comparison())
+        return lambda line: all(factor(line) for factor in factors)
+
+    def comparison():
+        if peek() == "(":
+            take()
+            inner = disjunction()
+            take(")")
+            return inner
+        field, name, value = take(), take(), take()
+        if name not in FILTER_OPERATORS:
+            raise ValueError(f"unsupported $filter operator: {name}")
+        compare, value = FILTER_OPERATORS[name], parse_filter_value(field, value)
+        return lambda line: compare(parse_filter_value(field, str(line[field])), value)
+
+    predicate = disjunction()
+    if peek() is not None:
+        raise ValueError(f"invalid $filter: {text}")
+    return predicate
+
+
+class Dataset:
+    """
+    :param patrimonies: nombre d'éléments du patrimoine louable
+    :param loan_lines: nombre de lignes de location, réparties sur l'année à venir
+    :param thematics: nombre de thématiques
+    :param attachment_size: taille en octets des pièces jointes téléchargées
+    """
+
+    def __init__(self, patrimonies=500, loan_lines=5000, thematics=200, attachment_size=512 * 1024, seed=0):
+        rng = random.Random(seed)
+
+        self.patrimonies = []
+        building = None
+        for index in range(1, patrimonies + 1):
+            # un bâtiment toutes les 10 entrées, des salles dedans, parfois une sous-salle
+            if index % 10 == 1:
+                patrimony_type, parent_id = 2, None
+                building = index
+            elif index % 10 == 9:
+                patrimony_type, parent_id = 1, index - 1
+            else:
+                patrimony_type, parent_id = 1, building
+            self.patrimonies.append(
+                {
+                    "Id": index,
+                    "Name": f"Patrimoine {index}",
+                    "Type": patrimony_type,
+                    "ParentId": parent_id,
+                    "CanBeLoaned": True,
+                    "Address": {"Street": f"Rue {index}", "ZipCode": "5000", "City": "Namur"},
+                    "FeaturesValues": [
+                        {"FeatureId": feature, "Value": "x" * 40, "AttachmentId": index * 10 + feature}
+                        for feature in range(3)
+                    ],
+                }
+            )
+        self.rooms = [patrimony["Id"] for patrimony in self.patrimonies if patrimony["Type"] == 1]
+
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time())
+        self.loan_lines = []
+        for index in range(1, loan_lines + 1):
+            start = today + datetime.timedelta(days=rng.randrange(365), hours=rng.randrange(8, 20))
+            end = start + datetime.timedelta(hours=rng.randrange(1, 4), minutes=-1)
+            self.loan_lines.append(
+                {
+                    "Id": index,
+                    "RoomId": rng.choice(self.rooms),
+                    "StartDate": start.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "EndDate": end.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+            )
+
+        self.thematics = [
+            {
+                "Id": index,
+                "Label": f"Thématique {index}",
+                "CompleteLabel": f"Domaine > Thématique {index}",
+                "ParentThematicId": None if index % 5 == 1 else index - index % 5 + 1,
+                "Archived": index % 17 == 0,
+            }
+            for index in range(1, thematics + 1)
+        ]
+
+        self.attachment = bytes(rng.getrandbits(8) for _ in range(min(attachment_size, 4096)))
+        self.attachment = (self.attachment * (attachment_size // max(len(self.attachment), 1) + 1))[:attachment_size]
+
+
+class FakeAtal:
+    """
+    serveur HTTP d'ATAL simulé
+    :param latency: délai ajouté à chaque réponse, en secondes
+    """
+
+    def __init__(self, dataset, latency=0.0):
+        self.dataset = dataset
+        self.latency = latency
+        self.calls = collections.Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_calls(self):
+        with self.lock:
+            self.calls.clear()
+
+    def call_count(self):
+        with self.lock:
+            return sum(self.calls.values())
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.handle(self, "GET")
+
+            def do_POST(self):
+                fake.handle(self, "POST")
+
+            def do_PATCH(self):
+                fake.handle(self, "PATCH")
+
+        return Handler
+
+    def handle(self, handler, method):
+        url = urlsplit(handler.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(handler.headers.get("Content-Length") or 0)
+        if length:
+            handler.rfile.read(length)
+        with self.lock:
+            self.calls[f"{method} {url.path}"] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        status, content_type, body = self.route(method, url.path, params)
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def route(self, method, path, params):
+        dataset = self.dataset
+        parts = path.strip("/").split("/")
+        if method == "POST" and path == "/api/RoomLoans":
+            return self.json({"Id": random.randrange(1, 10 ** 6)})
+        if path == "/api/Test":
+            return 200, "text/plain", b"OK"
+        if path == "/api/Patrimonies":
+            return self.json(self.page(dataset.patrimonies, params))
+        if path == "/api/RoomLoans/Lines":
+            lines = dataset.loan_lines
+            if params.get("$filter"):
+                try:
+                    predicate = parse_filter(params["$filter"])
+                except ValueError as e:
+                    return 400, "application/json", json.dumps({"detail": str(e)}).encode()
+                lines = [line for line in lines if predicate(line)]
+            return self.json(self.page(lines, params))
+        if path == "/api/Thematics":
+            return self.json(dataset.thematics)
+        if len(parts) == 3 and parts[:2] == ["api", "Patrimonies"]:
+            patrimony_id = int(parts[2])
+            return self.json(next((x for x in dataset.patrimonies if x["Id"] == patrimony_id), {}))
+        if len(parts) == 4 and parts[:3] == ["api", "Attachments", "Download"]:
+            return 200, "application/pdf", dataset.attachment
+        if len(parts) == 3 and parts[:2] == ["api", "Attachments"]:
+            return self.json({"Id": int(parts[2]), "Key": f"key{parts[2]}", "FileName": f"fichier-{parts[2]}.pdf"})
+        return 404, "application/json", b'{"detail": "not found"}'
+
+    def page(self, items, params):
+        if "$top" not in params:
+            return items
+        skip = int(params.get("$skip", 0))
+        return items[skip : skip + int(params["$top"])]
+
+    def json(self, data):
+        return 200, "application/json", json.dumps(data).encode()
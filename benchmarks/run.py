@@ -0,0 +1,196 @@
+"""
+Benchmarks du connecteur ATAL contre un faux serveur ATAL local (fake_atal.py).
+
+Pour chaque endpoint mesuré : durée du premier appel (caches vides) et des suivants,
+nombre d'appels reçus par ATAL et pic de mémoire allouée (tracemalloc). Les résultats
+sont écrits en JSON, pour comparer deux versions du connecteur.
+
+S'exécute dans un environnement passerelle où l'application est installée ; une base de
+données de test est créée puis supprimée, et le cache Django est remplacé par un cache
+local au processus :
+
+    DJANGO_SETTINGS_MODULE=passerelle.settings python benchmarks/run.py --output bench.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import fake_atal
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--patrimonies", type=int, default=500, help="taille du patrimoine louable")
+    parser.add_argument("--loan-lines", type=int, default=5000, help="nombre de lignes de location")
+    parser.add_argument("--thematics", type=int, default=200, help="nombre de thématiques")
+    parser.add_argument("--attachment-size", type=int, default=512 * 1024, help="taille des pièces jointes (octets)")
+    parser.add_argument("--latency", type=float, default=50, help="latence d'ATAL par appel (ms)")
+    parser.add_argument("--repeat", type=int, default=5, help="appels par endpoint, le premier à froid")
+    parser.add_argument("--mirror", action="store_true", help="synchroniser la copie locale des locations")
+    parser.add_argument("--only", action="append", help="endpoint à mesurer (répétable)")
+    parser.add_argument("--output", help="fichier JSON des résultats (sortie standard par défaut)")
+    return parser.parse_args()
+
+
+def scenarios(connector, dataset, factory):
+    """
+    :return: dict nom de l'endpoint -> fonction sans argument qui l'appelle
+    """
+    room = dataset.rooms[0]
+    day = (datetime.date.today() + datetime.timedelta(days=30)).isoformat()
+    attachment_id = dataset.patrimonies[0]["FeaturesValues"][0]["AttachmentId"]
+    bookings = iter(range(10 ** 6))
+
+    def bookings_room():
+        # une année lointaine, sans location synthétique, et une date différente par appel
+        booking_day = datetime.date(2099, 1, 1) + datetime.timedelta(days=next(bookings))
+        body = {
+            "booking_dates": [
+                {
+                    "start_date": booking_day.isoformat(),
+                    "start_time": f"{hour:02d}:00",
+                    "end_date": booking_day.isoformat(),
+                    "end_time": f"{hour:02d}:59",
+                }
+                for hour in (9, 10, 14)
+            ]
+        }
+        request = factory.post("/", data=json.dumps(body), content_type="application/json")
+        return connector.bookings_room(request, room)
+
+    return {
+        "generate-hour-availability": lambda: connector.generate_hour_availability(factory.get("/"), room),
+        "get-rooms-dispo": lambda: connector.read_rooms_dispo(factory.get("/"), day, day, "08:00", "12:00"),
+        "get-natures": lambda: connector.get_atal_thematics(factory.get("/")),
+        "get-attachments-file": lambda: connector.get_attachments_files(factory.get("/"), attachment_id),
+        "bookings-room": bookings_room,
+    }
+
+
+def measure(call, server, repeat):
+    # cache local au processus installé par main() : le vider ne touche à aucun cache réel
+    from django.core.cache import cache
+
+    cache.clear()
+    durations = []
+    calls = []
+    for _ in range(repeat):
+        server.reset_calls()
+        start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - start)
+        calls.append(server.call_count())
+
+    # pic de mémoire mesuré à part : tracemalloc ralentit l'exécution
+    cache.clear()
+    tracemalloc.start()
+    try:
+        call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    warm = durations[1:] or durations
+    return {
+        "cold_seconds": round(durations[0], 4),
+        "warm_seconds": round(statistics.median(warm), 4),
+        "cold_atal_calls": calls[0],
+        "warm_atal_calls": round(statistics.mean(calls[1:] or calls), 2),
+        "peak_memory_bytes": peak,
+    }
+
+
+def package_version():
+    try:
+        from importlib.metadata import version
+
+        return version("passerelle-imio-ia-tech")
+    except Exception:
+        return "unknown"
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "passerelle.settings")
+
+    import django
+    from django.conf import settings
+
+    # le benchmark vide le cache entre les mesures : il ne doit jamais viser le cache
+    # configuré (memcached partagé avec d'autres passerelles, par exemple)
+    settings.CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "passerelle-imio-ia-tech-benchmark",
+        }
+    }
+    django.setup()
+
+    from django.test import RequestFactory
+    from django.test.utils import setup_databases
+    from django.test.utils import setup_test_environment
+    from django.test.utils import teardown_databases
+    from passerelle_imio_ia_tech.models import imio_atal
+
+    dataset = fake_atal.Dataset(
+        patrimonies=args.patrimonies,
+        loan_lines=args.loan_lines,
+        thematics=args.thematics,
+        attachment_size=args.attachment_size,
+    )
+
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False)
+    try:
+        with fake_atal.FakeAtal(dataset, latency=args.latency / 1000) as server:
+            connector = imio_atal.objects.create(
+                slug="benchmark",
+                title="Benchmark",
+                description="Benchmark",
+                base_url=server.base_url,
+                api_key="benchmark",
+                loans_mirror_max_age=15 if args.mirror else 0,
+            )
+            connector.sync_rooms()
+            if args.mirror:
+                connector.sync_room_loan_lines(full=True)
+
+            results = {}
+            for name, call in scenarios(connector, dataset, RequestFactory()).items():
+                if args.only and name not in args.only:
+                    continue
+                results[name] = measure(call, server, args.repeat)
+    finally:
+        teardown_databases(databases, verbosity=0)
+
+    report = {
+        "version": package_version(),
+        "python": platform.python_version(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "patrimonies": args.patrimonies,
+            "loan_lines": args.loan_lines,
+            "thematics": args.thematics,
+            "attachment_size": args.attachment_size,
+            "latency_ms": args.latency,
+            "repeat": args.repeat,
+            "mirror": args.mirror,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fd:
+            fd.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
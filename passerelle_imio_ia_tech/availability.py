@@ -0,0 +1,339 @@
+import base64
+import datetime
+from zoneinfo import ZoneInfo
+
+# fuseau horaire des dates renvoyées par ATAL
+ATAL_TIMEZONE = ZoneInfo("Europe/Brussels")
+
+
+def string_to_datetime(date_string):
+    """
+    convertit les dates string de ATAL en datetime
+    :param date_string: string d'une date au format 2000-12-31T23:59...
+    :return: datetime(year, month, day, hour, minute)
+    """
+    # string de formatage pour strptime
+    format_datetime = "%Y-%m-%dT%H:%M"
+
+    return datetime.datetime.strptime(date_string[:16], format_datetime)
+
+
+def string_to_aware_datetime(date_string):
+    """
+    convertit les dates string de ATAL en datetime avec fuseau horaire, pour la base de données
+    :param date_string: string d'une date au format 2000-12-31T23:59...
+    """
+    return string_to_datetime(date_string).replace(tzinfo=ATAL_TIMEZONE)
+
+
+# jour 0 des dates exprimées en minutes ; les dates ATAL sont en heure locale
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def string_to_epoch_minutes(date_string):
+    """
+    convertit les dates string de ATAL en minutes depuis le 01/01/1970 00:00, sans strptime
+    :param date_string: string d'une date au format 2000-12-31T23:59...
+    """
+    day = datetime.date(int(date_string[0:4]), int(date_string[5:7]), int(date_string[8:10]))
+    return (day.toordinal() - EPOCH_ORDINAL) * MINUTES_PER_DAY + int(date_string[11:13]) * 60 + int(date_string[14:16])
+
+
+def datetime_to_epoch_minutes(value):
+    return (value.toordinal() - EPOCH_ORDINAL) * MINUTES_PER_DAY + value.hour * 60 + value.minute
+
+
+def date_to_epoch_day(value):
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+class LoanInterval:
+    """
+    ligne de location ATAL réduite à ce dont les disponibilités ont besoin : début et fin
+    en minutes depuis le 01/01/1970 (bornes comprises, à la minute près) et id de la salle
+    """
+
+    __slots__ = ("start", "end", "room_id")
+
+    def __init__(self, start, end, room_id=None):
+        self.start = start
+        self.end = end
+        self.room_id = room_id
+
+    @classmethod
+    def from_line(cls, line):
+        """
+        :param line: ligne de location ATAL (dict avec StartDate, EndDate et RoomId)
+        """
+        room_id = line.get("RoomId")
+        return cls(
+            string_to_epoch_minutes(line["StartDate"]),
+            string_to_epoch_minutes(line["EndDate"]),
+            int(room_id) if room_id is not None else None,
+        )
+
+    @property
+    def start_day(self):
+        return self.start // MINUTES_PER_DAY
+
+    @property
+    def end_day(self):
+        return self.end // MINUTES_PER_DAY
+
+    def __repr__(self):
+        return f"<LoanInterval room={self.room_id} {self.start}-{self.end}>"
+
+
+def loan_intervals(loans):
+    """
+    convertit les lignes de location ATAL en LoanInterval, chaque date n'étant analysée qu'une seule fois
+    """
+    return [LoanInterval.from_line(loan) for loan in loans]
+
+
+def merge_intervals(intervals):
+    """
+    trie et fusionne des intervalles fermés [début, fin]
+    :param intervals: itérable de tuples (début, fin) comparables
+    :return: liste triée d'intervalles disjoints [début, fin]
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        # un intervalle dont la fin précède le début ne bloque rien
+        if start > end:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def blocked_flags(points, intervals):
+    """
+    indique pour chaque point s'il tombe dans un des intervalles, bornes comprises
+    un seul passage suffit : les points et les intervalles fusionnés sont triés
+    :param points: liste triée de valeurs comparables aux bornes des intervalles
+    :param intervals: itérable de tuples (début, fin)
+    :return: liste de booléens, un par point
+    """
+    merged = merge_intervals(intervals)
+    count = len(merged)
+    index = 0
+    flags = []
+    for point in points:
+        while index < count and merged[index][1] < point:
+            index += 1
+        flags.append(index < count and merged[index][0] <= point)
+    return flags
+
+
+def hour_slot(hour, disabled):
+    """
+    construit l'entrée de la source de données pour une heure
+    :param hour: datetime du début de l'heure
+    :param disabled: True si l'heure est indisponible
+    """
+    # un seul strftime par heure, les autres champs en sont extraits
+    iso = hour.strftime("%Y-%m-%dT%H:%M")
+    return {
+        "text": f"{iso[8:10]}/{iso[5:7]}/{iso[:4]} {iso[11:]}",
+        "id": iso,
+        "start_date": iso[:10],
+        "end_date": iso[:10],
+        "start_time": iso[11:],
+        "end_time": f"{iso[11:13]}:59",
+        "disabled": disabled,
+    }
+
+
+def day_slot(day, disabled):
+    """
+    construit l'entrée de la source de données pour un jour
+    :param day: date du jour
+    :param disabled: True si le jour est indisponible
+    """
+    iso = day.strftime("%Y-%m-%d")
+    return {
+        "text": f"{iso[8:]}/{iso[5:7]}/{iso[:4]}",
+        "id": iso,
+        "start_date": iso,
+        "end_date": iso,
+        "start_time": "00:00",
+        "end_time": "23:59",
+        "disabled": disabled,
+    }
+
+
+def hours_between(start_datetime, end_datetime):
+    """heures entre deux datetimes, bornes comprises"""
+    delta = int((end_datetime - start_datetime).total_seconds() / 3600)
+    return [start_datetime + datetime.timedelta(hours=x) for x in range(delta + 1)]
+
+
+def days_between(start_date, end_date):
+    """jours entre deux dates, bornes comprises"""
+    delta = end_date - start_date
+    return [start_date + datetime.timedelta(days=x) for x in range(delta.days + 1)]
+
+
+def hour_flags(intervals, hours):
+    """
+    indisponibilité de chaque heure : une heure est bloquée si elle tombe dans une
+    location ou sur ses bornes
+    :param intervals: LoanInterval
+    :param hours: datetimes triés
+    """
+    points = [datetime_to_epoch_minutes(hour) for hour in hours]
+    return blocked_flags(points, [(interval.start, interval.end) for interval in intervals])
+
+
+def day_flags(intervals, days):
+    """
+    indisponibilité de chaque jour : un jour est bloqué s'il est compris entre le jour
+    de début et le jour de fin d'une location
+    :param intervals: LoanInterval
+    :param days: dates triées
+    """
+    points = [date_to_epoch_day(day) for day in days]
+    return blocked_flags(points, [(interval.start_day, interval.end_day) for interval in intervals])
+
+
+# formats de sortie des sources de données de disponibilité
+AVAILABILITY_FORMATS = ("slots", "ranges", "bitmap")
+
+
+def format_availability(points, flags, slot, output_format="slots"):
+    """
+    met en forme la disponibilité de chaque heure ou de chaque jour
+    :param points: heures (datetime) ou jours (date), triés
+    :param flags: indisponibilité de chaque point
+    :param slot: hour_slot ou day_slot
+    :param output_format:
+        - slots : une entrée par point, pour les sources de données w.c.s.
+        - ranges : une entrée par suite de points de même disponibilité
+        - bitmap : un bit par point (1 = indisponible) encodé en base64
+    """
+    if output_format == "ranges":
+        ranges = []
+        first = 0
+        for index in range(1, len(points) + 1):
+            if index == len(points) or flags[index] != flags[first]:
+                start_slot, end_slot = slot(points[first], flags[first]), slot(points[index - 1], flags[first])
+                ranges.append(
+                    {
+                        "start_date": start_slot["start_date"],
+                        "start_time": start_slot["start_time"],
+                        "end_date": end_slot["end_date"],
+                        "end_time": end_slot["end_time"],
+                        "disabled": flags[first],
+                    }
+                )
+                first = index
+        return ranges
+
+    if output_format == "bitmap":
+        bits = bytearray((len(flags) + 7) // 8)
+        for index, disabled in enumerate(flags):
+            if disabled:
+                bits[index >> 3] |= 0x80 >> (index & 7)
+        return {
+            "start": slot(points[0], False)["id"] if points else None,
+            "count": len(flags),
+            "bitmap": base64.b64encode(bits).decode("ascii"),
+        }
+
+    return [slot(point, disabled) for point, disabled in zip(points, flags)]
+
+
+# nombre de jours couverts par les tableaux d'occupation, à partir d'aujourd'hui :
+# de quoi répondre aux demandes jusqu'à end=365 inclus
+OCCUPANCY_DAYS = 367
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def _set_bits(bits, first, last, size):
+    """met à 1 les bits first à last inclus, limités à [0, size["""
+    for index in range(max(first, 0), min(last, size - 1) + 1):
+        bits[index >> 3] |= 0x80 >> (index & 7)
+
+
+def _get_bits(bits, first, count):
+    return [bool(bits[index >> 3] & (0x80 >> (index & 7))) for index in range(first, first + count)]
+
+
+class Occupancy:
+    """
+    occupation d'une ou plusieurs salles sur OCCUPANCY_DAYS jours à partir de `origin`,
+    sous forme de deux tableaux de bits : un bit par heure (~1 Ko) et un bit par jour
+
+    les règles sont celles de hour_availability et day_availability : une heure est
+    occupée si elle tombe dans une location ou sur ses bornes, un jour s'il est compris
+    entre le jour de début et le jour de fin d'une location
+    """
+
+    hours_size = OCCUPANCY_DAYS * 24
+    days_size = OCCUPANCY_DAYS
+
+    def __init__(self, origin, hours=None, days=None):
+        self.origin = origin
+        self.hours = bytearray(hours) if hours is not None else bytearray((self.hours_size + 7) // 8)
+        self.days = bytearray(days) if days is not None else bytearray((self.days_size + 7) // 8)
+
+    @classmethod
+    def from_intervals(cls, origin, intervals):
+        """
+        :param origin: premier jour couvert
+        :param intervals: LoanInterval
+        """
+        occupancy = cls(origin)
+        origin_day = date_to_epoch_day(origin)
+        origin_minutes = origin_day * MINUTES_PER_DAY
+        for start, end in merge_intervals((interval.start, interval.end) for interval in intervals):
+            # première heure pleine à partir du début, dernière heure pleine avant la fin
+            first = -((origin_minutes - start) // 60)
+            last = (end - origin_minutes) // 60
+            _set_bits(occupancy.hours, first, last, cls.hours_size)
+        for start, end in merge_intervals((interval.start_day, interval.end_day) for interval in intervals):
+            _set_bits(occupancy.days, start - origin_day, end - origin_day, cls.days_size)
+        return occupancy
+
+    def __or__(self, other):
+        return Occupancy(
+            self.origin,
+            (int.from_bytes(self.hours, "big") | int.from_bytes(other.hours, "big")).to_bytes(len(self.hours), "big"),
+            (int.from_bytes(self.days, "big") | int.from_bytes(other.days, "big")).to_bytes(len(self.days), "big"),
+        )
+
+    def dumps(self):
+        """valeur sérialisable, pour le cache"""
+        return (self.origin.toordinal(), bytes(self.hours), bytes(self.days))
+
+    @classmethod
+    def loads(cls, value):
+        origin, hours, days = value
+        return cls(datetime.date.fromordinal(origin), hours, days)
+
+    def hour_flags(self, start_datetime, count):
+        """
+        :return: occupation de `count` heures à partir de start_datetime, ou None si elles
+                 sortent de la période couverte
+        """
+        first = (start_datetime - datetime.datetime.combine(self.origin, datetime.time())) // HOUR
+        if first < 0 or first + count > self.hours_size:
+            return None
+        return _get_bits(self.hours, first, count)
+
+    def day_flags(self, start_date, count):
+        """
+        :return: occupation de `count` jours à partir de start_date, ou None s'ils sortent
+                 de la période couverte
+        """
+        first = (start_date - self.origin).days
+        if first < 0 or first + count > self.days_size:
+            return None
+        return _get_bits(self.days, first, count)
@@ -0,0 +1,637 @@
+import contextlib
+import functools
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import ijson
+import requests
+import urllib3
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.http import JsonResponse
+from django.http.response import HttpResponseBase
+from django.utils.functional import cached_property
+from passerelle.utils.jsonresponse import APIError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import Metrics
+
+# pools de connexions HTTP par connecteur, partagés par les threads du processus : les
+# connexions vers ATAL restent ouvertes (keep-alive) d'un appel à l'autre
+_adapters = {}
+_adapters_lock = threading.Lock()
+
+# appel d'endpoint en cours, par thread
+_local = threading.local()
+
+
+class Invocation:
+    """
+    appel d'un endpoint du connecteur, endpoints appelés à l'intérieur compris :
+    GET vers ATAL mémorisés et décompte des appels à ATAL
+    """
+
+    def __init__(self):
+        # réponses des GET déjà faits
+        self.memo = {}
+        self.calls = 0
+        self.memo_hits = 0
+        # octets reçus d'ATAL
+        self.bytes = 0
+        # somme des durées des appels à ATAL, en secondes ; les appels faits en parallèle
+        # par fan_out s'additionnent
+        self.atal_time = 0
+        self.lock = threading.Lock()
+
+    def record_call(self, duration, size):
+        with self.lock:
+            self.calls += 1
+            self.bytes += size
+            self.atal_time += duration
+
+    def record_memo_hit(self):
+        with self.lock:
+            self.memo_hits += 1
+
+
+def current_invocation():
+    return getattr(_local, "invocation", None)
+
+
+def current_memo():
+    invocation = current_invocation()
+    return invocation.memo if invocation is not None else None
+
+
+@contextlib.contextmanager
+def invocation_scope(invocation):
+    """
+    rend `invocation` active dans le thread courant, par exemple dans les threads de fan_out
+    """
+    previous = current_invocation()
+    _local.invocation = invocation
+    try:
+        yield invocation
+    finally:
+        _local.invocation = previous
+
+
+def instrumented_endpoint(func):
+    """
+    le temps d'un appel d'endpoint :
+    - mémorise les GET vers ATAL : un même GET n'est fait qu'une fois, y compris par les
+      endpoints appelés à l'intérieur de celui-ci (request._atal_memo) ;
+    - compte les appels à ATAL, les octets reçus et le temps passé à attendre ATAL, dans
+      le journal du connecteur et, si call_accounting_headers est coché, dans les en-têtes
+      X-Atal-Calls et Server-Timing de la réponse.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        # endpoint appelé par un autre endpoint : l'appel en cours est déjà suivi
+        if current_invocation() is not None:
+            return func(self, *args, **kwargs)
+        request = args[0] if args else kwargs.get("request")
+        invocation = getattr(request, "_atal_invocation", None)
+        if invocation is None:
+            invocation = Invocation()
+            if request is not None:
+                request._atal_invocation = invocation
+                request._atal_memo = invocation.memo
+
+        start = time.monotonic()
+        error = None
+        try:
+            with invocation_scope(invocation):
+                result = func(self, *args, **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # les appels en erreur (délai dépassé, disjoncteur ouvert, conflit) sont comptés
+            # aussi : ce sont les plus utiles pour comprendre une dégradation
+            wall_time = time.monotonic() - start
+            local_time = max(wall_time - invocation.atal_time, 0)
+            self.logger.info(
+                f"{func.endpoint_info.name or func.__name__}: {invocation.calls} ATAL calls "
+                f"({invocation.memo_hits} memoized), {invocation.bytes} bytes, "
+                f"ATAL {invocation.atal_time * 1000:.0f} ms, local {local_time * 1000:.0f} ms"
+                + (f", failed: {error}" if error is not None else "")
+            )
+        if self.call_accounting_headers and request is not None:
+            result = add_accounting_headers(result, invocation, local_time)
+        return result
+
+    return wrapper
+
+
+def add_accounting_headers(result, invocation, local_time):
+    # passerelle sérialise lui-même les résultats : la réponse est construite ici pour porter
+    # les en-têtes, comme passerelle le ferait ({"err": 0, "data": ...} pour les listes et None)
+    if isinstance(result, dict):
+        result = JsonResponse({"err": 0, **result} if "err" not in result else result)
+    elif not isinstance(result, HttpResponseBase):
+        result = JsonResponse({"err": 0, "data": result})
+    result["X-Atal-Calls"] = str(invocation.calls)
+    result["Server-Timing"] = (
+        f'atal;dur={invocation.atal_time * 1000:.1f};desc="{invocation.calls} calls", '
+        f"app;dur={local_time * 1000:.1f}"
+    )
+    return result
+
+
+def instrument_endpoints(cls):
+    """décorateur de classe : applique instrumented_endpoint à tous les endpoints du connecteur"""
+    for name, method in list(vars(cls).items()):
+        if hasattr(method, "endpoint_info"):
+            setattr(cls, name, instrumented_endpoint(method))
+    return cls
+
+
+def route_template(method, path, params=None):
+    """
+    route ATAL d'un appel, pour regrouper les mesures : les segments variables (ids,
+    uuid, clés) sont remplacés par {id} et les $expand, souvent coûteux, sont distingués
+    :return: par exemple "GET /api/Patrimonies/{id} $expand"
+    """
+    path = path.split("?", 1)[0]
+    segments = ["{id}" if any(c.isdigit() for c in segment) else segment for segment in path.split("/")]
+    route = f"{method} {'/'.join(segments)}"
+    if params and params.get("$expand"):
+        route += " $expand"
+    return route
+
+
+class LatencyTracker:
+    """
+    durées des derniers appels par route ATAL, dans le processus, pour un connecteur ;
+    le délai d'attente d'une route est son 99e centile multiplié par
+    adaptive_timeout_factor, borné par adaptive_timeout_floor et adaptive_timeout_ceiling
+    """
+
+    # durées par (connecteur, route)
+    _samples = {}
+    _lock = threading.Lock()
+
+    def __init__(self, resource):
+        self.resource = resource
+
+    def record(self, route, duration):
+        key = (self.resource.pk, route)
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.resource.adaptive_timeout_samples)
+            samples.append(duration)
+
+    def percentile(self, route, percent):
+        with self._lock:
+            samples = sorted(self._samples.get((self.resource.pk, route), ()))
+        if not samples:
+            return None
+        return samples[min(math.ceil(len(samples) * percent / 100) - 1, len(samples) - 1)]
+
+    def timeout(self, route):
+        """
+        :return: délai d'attente en secondes ; requests_timeout tant que la route n'a pas
+                 assez de mesures
+        """
+        resource = self.resource
+        with self._lock:
+            count = len(self._samples.get((resource.pk, route), ()))
+        if count < resource.adaptive_timeout_min_samples:
+            return resource.requests_timeout
+        timeout = self.percentile(route, 99) * resource.adaptive_timeout_factor
+        return min(max(timeout, resource.adaptive_timeout_floor), resource.adaptive_timeout_ceiling)
+
+
+class CircuitBreaker:
+    """
+    disjoncteur par connecteur, partagé par tous les workers via le cache Django :
+    - fermé : les appels passent, les échecs consécutifs (erreur réseau, délai dépassé,
+      réponse 5xx) sont comptés ;
+    - ouvert après circuit_breaker_threshold échecs : les appels échouent immédiatement
+      pendant circuit_breaker_reset_timeout secondes ;
+    - semi-ouvert ensuite : un seul appel d'essai passe, il referme le disjoncteur s'il
+      réussit et le rouvre sinon.
+    """
+
+    def __init__(self, resource):
+        self.resource = resource
+        prefix = f"passerelle-imio-ia-tech-{resource.pk}-breaker"
+        self.failures_key = f"{prefix}-failures"
+        self.open_key = f"{prefix}-open-until"
+        self.probe_key = f"{prefix}-probe"
+        # un essai interrompu sans réponse libère sa place après le plus long délai d'attente
+        self.probe_timeout = 2 * max(resource.requests_timeout, resource.adaptive_timeout_ceiling)
+
+    def before_call(self):
+        """
+        :raise APIError: si le disjoncteur est ouvert
+        :return: True si des échecs sont en cours de comptage ou si l'appel est un essai
+        """
+        state = cache.get_many([self.failures_key, self.open_key])
+        open_until = state.get(self.open_key)
+        if open_until is None:
+            return bool(state.get(self.failures_key))
+
+        now = time.time()
+        # un seul essai à la fois, les autres appels échouent immédiatement
+        if now < open_until or not cache.add(self.probe_key, True, self.probe_timeout):
+            retry_in = max(int(open_until - now), 0) + 1
+            raise APIError(
+                f"ATAL Error: service unavailable after {self.resource.circuit_breaker_threshold} "
+                f"consecutive failures, next attempt in {retry_in}s",
+                data={"circuit_breaker": "open", "retry_in": retry_in},
+            )
+        return True
+
+    def success(self):
+        cache.delete_many([self.failures_key, self.open_key, self.probe_key])
+
+    def failure(self):
+        cache.add(self.failures_key, 0, None)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            failures = 1
+        # le seuil est atteint, ou l'essai en semi-ouvert a échoué
+        if failures >= self.resource.circuit_breaker_threshold or cache.get(self.open_key) is not None:
+            self.resource.logger.warning(f"ATAL circuit breaker open after {failures} consecutive failures")
+            cache.set(self.open_key, time.time() + self.resource.circuit_breaker_reset_timeout, None)
+            cache.delete(self.probe_key)
+
+
+class AtalClient:
+    """
+    accès à l'API d'une instance ATAL : en-têtes, erreurs et décodage JSON centralisés,
+    connexions HTTP réutilisées entre les appels
+    """
+
+    # Durée, en secondes, pendant laquelle une réponse expirée reste en cache pour être
+    # revalidée (If-None-Match / If-Modified-Since) plutôt que téléchargée à nouveau.
+    revalidation_retention = 7 * 24 * 3600
+
+    # Durée maximum, en secondes, d'un appel à ATAL dont le résultat est partagé ; au-delà,
+    # le verrou d'un worker interrompu est ignoré.
+    fetch_lock_timeout = 60
+
+    # Attente maximum, en secondes, du résultat d'un appel lancé par un autre worker ;
+    # au-delà, ATAL est interrogé directement.
+    coalesce_timeout = 30
+    coalesce_poll_interval = 0.1
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.breaker = CircuitBreaker(resource)
+        self.latency = LatencyTracker(resource)
+        self.metrics = Metrics(resource)
+
+    @property
+    def adapter(self):
+        """pool de connexions du connecteur, un seul par processus"""
+        key = (self.resource.pk, self.resource.http_pool_size)
+        with _adapters_lock:
+            adapter = _adapters.get(key)
+            if adapter is None:
+                max_retries = dict(getattr(settings, "REQUESTS_MAX_RETRIES", {}))
+                max_retries.update(self.resource.requests_max_retries)
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.resource.http_pool_size,
+                    max_retries=Retry(**max_retries),
+                )
+                for old_key in [old_key for old_key in _adapters if old_key[0] == self.resource.pk]:
+                    _adapters.pop(old_key).close()
+                _adapters[key] = adapter
+        return adapter
+
+    @cached_property
+    def session(self):
+        # self.requests de passerelle, construit à partir du connecteur tel qu'il est
+        # enregistré (journalisation, délai d'attente, proxy), avec le pool partagé
+        session = self.resource.requests
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+        return session
+
+    def request(self, method, path, params=None, accept="application/json", raise_for_status=True, **kwargs):
+        """
+        :param path: chemin de l'API, comme /api/Patrimonies
+        :param raise_for_status: si False, les réponses en erreur sont renvoyées telles quelles
+        :return: requests.Response
+        """
+        headers = {"accept": accept, "X-API-Key": self.resource.api_key}
+        headers.update(kwargs.pop("headers", {}))
+
+        # une écriture peut changer ce que renverraient les GET déjà mémorisés
+        memo = current_memo()
+        if method != "GET" and memo:
+            memo.clear()
+
+        route = route_template(method, path, params)
+        if method in ("GET", "HEAD"):
+            kwargs.setdefault("timeout", self.latency.timeout(route))
+        else:
+            # une écriture lente qu'ATAL finit par enregistrer ne doit pas échouer de notre
+            # côté : le client réessaierait et créerait un doublon
+            kwargs.setdefault("timeout", self.resource.requests_timeout)
+
+        tracked = self.breaker.before_call()
+        start = time.monotonic()
+        try:
+            response = self.session.request(
+                method,
+                f"{self.resource.base_url}{path}",
+                params=params,
+                headers=headers,
+                verify=self.resource.verify_cert,
+                **kwargs,
+            )
+        except requests.RequestException as e:
+            # un appel interrompu par le délai d'attente compte pour au moins ce délai : la
+            # route garde de la marge au lieu de voir son délai se réduire
+            duration = time.monotonic() - start
+            if isinstance(e, requests.Timeout):
+                self.latency.record(route, duration)
+            self.metrics.observe_call(route, "timeout" if isinstance(e, requests.Timeout) else "error", duration)
+            invocation = current_invocation()
+            if invocation is not None:
+                invocation.record_call(duration, 0)
+            self.breaker.failure()
+            self.resource.logger.warning(f"ATAL Error: {e}")
+            raise APIError(f"ATAL Error: {e}")
+
+        duration = time.monotonic() - start
+        self.latency.record(route, duration)
+        self.metrics.observe_call(route, response.status_code, duration)
+        invocation = current_invocation()
+        if invocation is not None:
+            # le corps d'une réponse lue en flux n'est pas encore téléchargé
+            if kwargs.get("stream"):
+                size = int(response.headers.get("Content-Length") or 0)
+            else:
+                size = len(response.content)
+            invocation.record_call(duration, size)
+
+        if response.status_code >= 500:
+            self.breaker.failure()
+        elif tracked:
+            self.breaker.success()
+
+        if raise_for_status:
+            self.raise_for_status(response)
+
+        return response
+
+    def raise_for_status(self, response):
+        try:
+            response.raise_for_status()
+        except requests.RequestException as e:
+            try:
+                err_data = response.json()
+            except ValueError:
+                err_data = {"response_text": response.text}
+            self.resource.logger.warning(f"ATAL Error: {e}")
+            raise APIError(f"ATAL Error: {e}", data=err_data)
+
+    def decode(self, response):
+        try:
+            return response.json()
+        except ValueError:
+            self.resource.logger.warning("ATAL Error: bad JSON response")
+            raise APIError("ATAL Error: bad JSON response")
+
+    def get(self, path, params=None, cache_timeout=None, stale_timeout=None, **kwargs):
+        """
+        :param cache_timeout: durée, en secondes, pendant laquelle la réponse est réutilisée
+                              sans interroger ATAL ; au-delà elle est revalidée grâce à son
+                              ETag ou à sa date Last-Modified si ATAL les a fournis
+        :param stale_timeout: âge, en secondes, jusqu'auquel une réponse expirée est encore
+                              renvoyée immédiatement, pendant qu'un thread la rafraîchit
+        """
+        memo = current_memo()
+        if memo is not None:
+            memo_key = (self.cache_key(path, params), kwargs.get("accept"), kwargs.get("raise_for_status", True))
+            if memo_key in memo:
+                current_invocation().record_memo_hit()
+                return memo[memo_key]
+
+        if not cache_timeout:
+            data = self.decode(self.request("GET", path, params=params, **kwargs))
+        else:
+            data = self.cached_get(path, params, cache_timeout, stale_timeout or 0, **kwargs)
+
+        if memo is not None:
+            memo[memo_key] = data
+        return data
+
+    def cache_key(self, path, params):
+        params = sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None)
+        digest = hashlib.md5(json.dumps([path, params]).encode()).hexdigest()
+        return f"passerelle-imio-ia-tech-{self.resource.pk}-get-{digest}"
+
+    def cached_get(self, path, params, cache_timeout, stale_timeout, **kwargs):
+        key = self.cache_key(path, params)
+        uncacheable_key = f"{key}-uncacheable"
+        values = cache.get_many([key, uncacheable_key])
+        entry = values.get(key)
+        if entry:
+            age = time.time() - entry["fetched"]
+            if age < cache_timeout:
+                self.metrics.observe_cache("reference", "hit")
+                return entry["data"]
+            if age < stale_timeout:
+                self.metrics.observe_cache("reference", "stale")
+                self.refresh_in_background(key, path, params, entry, cache_timeout, stale_timeout, **kwargs)
+                return entry["data"]
+
+        # réponse que le cache refuse de garder : attendre celle d'un autre worker ne
+        # servirait à rien
+        if uncacheable_key in values:
+            return self.fetch(key, path, params, entry, cache_timeout, stale_timeout, **kwargs)
+
+        # un seul worker interroge ATAL, les autres attendent et réutilisent sa réponse
+        lock_key = f"{key}-fetching"
+        if not cache.add(lock_key, True, self.fetch_lock_timeout):
+            deadline = time.time() + self.coalesce_timeout
+            while time.time() < deadline:
+                time.sleep(self.coalesce_poll_interval)
+                shared = cache.get_many([key, uncacheable_key])
+                if key in shared and time.time() - shared[key]["fetched"] < cache_timeout:
+                    self.metrics.observe_cache("reference", "hit")
+                    return shared[key]["data"]
+                if uncacheable_key in shared:
+                    return self.fetch(key, path, params, entry, cache_timeout, stale_timeout, **kwargs)
+                # verrou relâché sans réponse gardée (erreur) : ce worker prend le relais
+                if cache.add(lock_key, True, self.fetch_lock_timeout):
+                    break
+            else:
+                return self.fetch(key, path, params, entry, cache_timeout, stale_timeout, **kwargs)
+        try:
+            return self.fetch(key, path, params, entry, cache_timeout, stale_timeout, **kwargs)
+        finally:
+            cache.delete(lock_key)
+
+    def fetch(self, key, path, params, entry, cache_timeout, stale_timeout, raise_for_status=True, **kwargs):
+        """
+        interroge ATAL, avec les validateurs de l'entrée en cache s'il y en a une, et
+        enregistre la réponse
+        """
+        fetched = time.time()
+        headers = dict(kwargs.pop("headers", {}))
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        response = self.request("GET", path, params=params, headers=headers, raise_for_status=False, **kwargs)
+
+        if entry and response.status_code == 304:
+            self.metrics.observe_cache("reference", "revalidated")
+            data = entry["data"]
+        else:
+            self.metrics.observe_cache("reference", "miss")
+            if raise_for_status:
+                self.raise_for_status(response)
+            data = self.decode(response)
+            # les réponses en erreur ne sont jamais gardées
+            if not response.ok:
+                return data
+            entry = {
+                "data": data,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+
+        entry["fetched"] = fetched
+        timeout = cache_timeout
+        if entry["etag"] or entry["last_modified"]:
+            timeout += self.revalidation_retention
+        timeout = max(timeout, stale_timeout)
+        cache.set(key, entry, timeout)
+        # memcached refuse sans erreur les valeurs de plus de 1 Mo : les workers qui attendent
+        # cette réponse interrogeraient ATAL l'un après l'autre
+        if not cache.touch(key, timeout) and cache.add(f"{key}-uncacheable", True, cache_timeout):
+            self.resource.logger.warning(f"ATAL response for {path} is too large to be cached")
+        return data
+
+    def refresh_in_background(self, key, path, params, entry, cache_timeout, stale_timeout, **kwargs):
+        # un seul appel à la fois par réponse, tous processus confondus
+        lock_key = f"{key}-fetching"
+        if not cache.add(lock_key, True, self.fetch_lock_timeout):
+            return
+
+        def refresh():
+            try:
+                self.fetch(key, path, params, entry, cache_timeout, stale_timeout, **kwargs)
+            except APIError:
+                # déjà journalisé ; la réponse périmée reste servie
+                pass
+            finally:
+                cache.delete(lock_key)
+                connections.close_all()
+
+        # thread non daemon : un rafraîchissement commencé se termine même si le
+        # processus s'arrête (cron)
+        threading.Thread(target=refresh, name=f"atal-refresh-{self.resource.pk}").start()
+
+    def iter_json(self, path, params=None, fields=None):
+        """
+        lit une liste JSON renvoyée par ATAL élément par élément, sans la charger entière en
+        mémoire (ijson)
+        :param fields: champs gardés dans chaque élément, au fur et à mesure de la lecture ;
+                       tous si None
+        :return: générateur des éléments réduits à `fields`
+        """
+        route = route_template("GET", path, params)
+        start = time.monotonic()
+        response = self.request("GET", path, params=params, stream=True)
+        with contextlib.closing(response):
+            # les réponses compressées sont décompressées à la lecture
+            response.raw.decode_content = True
+            try:
+                for item in ijson.items(response.raw, "item", use_float=True):
+                    if fields is not None:
+                        item = {key: value for key, value in item.items() if key in fields}
+                    yield item
+            except ijson.JSONError:
+                self.resource.logger.warning("ATAL Error: bad JSON response")
+                raise APIError("ATAL Error: bad JSON response")
+            except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+                # connexion coupée, délai dépassé ou compression invalide pendant la lecture du
+                # corps : l'appel, compté comme réussi à la réception des en-têtes, a échoué
+                duration = time.monotonic() - start
+                timeout = isinstance(e, (requests.Timeout, urllib3.exceptions.TimeoutError))
+                self.metrics.observe_call(route, "timeout" if timeout else "error", duration)
+                self.breaker.failure()
+                self.resource.logger.warning(f"ATAL Error: {e}")
+                raise APIError(f"ATAL Error: {e}")
+
+    def iter_items(self, path, params=None, page_size=None):
+        """
+        parcourt une collection ATAL page par page : les pages ne sont demandées qu'au fur et
+        à mesure de la lecture, l'appelant peut s'arrêter avant la fin
+        :param page_size: nombre d'éléments par page ($top), par défaut odata_page_size du
+                          connecteur ; 0 pour tout lire en un seul appel
+        :return: générateur des éléments de la collection
+        """
+        params = dict(params or {})
+        if page_size is None:
+            page_size = self.resource.odata_page_size
+        if not page_size:
+            yield from self.page_items(self.get_page(path, params))
+            return
+
+        # un ordre stable est nécessaire pour que $skip ne saute ni ne répète aucun élément
+        params.setdefault("$orderby", "Id")
+        params["$top"] = page_size
+        skip = 0
+        while True:
+            params["$skip"] = skip
+            page = self.get_page(path, params)
+            items = self.page_items(page)
+            yield from items
+
+            next_link = page.get("@odata.nextLink") if isinstance(page, dict) else None
+            if next_link:
+                # pagination imposée par le serveur : le lien contient déjà les paramètres
+                yield from self.iter_next_links(next_link)
+                return
+            # page incomplète : fin de la collection ; page trop grande : $top ignoré par le serveur
+            if len(items) != page_size:
+                return
+            skip += page_size
+
+    def iter_next_links(self, next_link):
+        while next_link:
+            url = urlsplit(next_link)
+            path = url.path if not url.query else f"{url.path}?{url.query}"
+            base_path = urlsplit(self.resource.base_url).path
+            if base_path and path.startswith(base_path):
+                path = path[len(base_path) :]
+            page = self.get_page(path)
+            yield from self.page_items(page)
+            next_link = page.get("@odata.nextLink") if isinstance(page, dict) else None
+
+    def get_page(self, path, params=None):
+        # pas de mémorisation : les pages déjà lues ne doivent pas rester en mémoire
+        return self.decode(self.request("GET", path, params=params))
+
+    def page_items(self, page):
+        # ATAL renvoie une liste ; une réponse OData complète met les éléments dans "value"
+        if isinstance(page, dict):
+            return page.get("value", [])
+        return page
+
+    def post(self, path, **kwargs):
+        return self.decode(self.request("POST", path, **kwargs))
+
+    def patch(self, path, **kwargs):
+        return self.decode(self.request("PATCH", path, **kwargs))
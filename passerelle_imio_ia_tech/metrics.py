@@ -0,0 +1,161 @@
+import time
+
+from django.core.cache import cache
+
+# bornes supérieures, en secondes, des intervalles de l'histogramme des durées d'appel
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60)
+
+# caches suivis et résultats possibles d'une lecture
+CACHE_RESULTS = {
+    # données de référence (AtalClient.cached_get) ; revalidated et miss comptent les
+    # appels à ATAL, y compris les rafraîchissements en arrière-plan
+    "reference": ("hit", "stale", "revalidated", "miss"),
+    # tableaux d'occupation des salles
+    "occupancy": ("hit", "miss"),
+}
+
+
+def _incr(key, delta=1):
+    """
+    :return: nouvelle valeur du compteur, None si la mesure est perdue
+    """
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            # clé expulsée entre-temps : la mesure est perdue
+            return None
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Metrics:
+    """
+    compteurs d'un connecteur gardés dans le cache Django, donc partagés par tous les
+    workers : durée des appels à ATAL par route et par statut, lectures des caches
+    """
+
+    # séries (route, statut) déjà enregistrées par ce processus, par connecteur, avec la date
+    # de la dernière vérification : une série perdue (cache vidé) est réenregistrée
+    _known_series = {}
+    known_series_check_interval = 3600
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.prefix = f"passerelle-imio-ia-tech-{resource.pk}-metrics"
+        # séries numérotées de 1 à la valeur de series_count_key, dans {series_key}-{numéro}
+        self.series_key = f"{self.prefix}-series"
+        self.series_count_key = f"{self.prefix}-series-count"
+
+    def series_prefix(self, route, status):
+        return f"{self.prefix}-call-{route}-{status}".replace(" ", "_")
+
+    def observe_call(self, route, status, duration):
+        """
+        :param route: route ATAL (voir client.route_template)
+        :param status: code HTTP de la réponse, ou "timeout" / "error"
+        :param duration: durée en secondes
+        """
+        self.register_series(route, status)
+        prefix = self.series_prefix(route, status)
+        bucket = next((index for index, bound in enumerate(DURATION_BUCKETS) if duration <= bound), "inf")
+        _incr(f"{prefix}-bucket-{bucket}")
+        _incr(f"{prefix}-count")
+        _incr(f"{prefix}-sum-ms", int(duration * 1000))
+
+    def register_series(self, route, status):
+        known = (self.resource.pk, route, str(status))
+        now = time.time()
+        if now - self._known_series.get(known, 0) < self.known_series_check_interval:
+            return
+        # cache.add est atomique : un seul worker numérote une nouvelle série, sans
+        # lecture-modification-écriture d'une liste partagée
+        if cache.add(f"{self.series_prefix(route, status)}-registered", True, None):
+            index = _incr(self.series_count_key)
+            if index is not None:
+                cache.set(f"{self.series_key}-{index}", [route, str(status)], None)
+        self._known_series[known] = now
+
+    def series(self):
+        """
+        :return: liste des séries (route, statut) enregistrées
+        """
+        count = cache.get(self.series_count_key) or 0
+        values = cache.get_many([f"{self.series_key}-{index}" for index in range(1, count + 1)])
+        return sorted({tuple(value) for value in values.values()})
+
+    def observe_cache(self, name, result, count=1):
+        if count:
+            _incr(f"{self.prefix}-cache-{name}-{result}", count)
+
+    def render(self, breaker):
+        """
+        :param breaker: client.CircuitBreaker du connecteur
+        :return: métriques au format texte de Prometheus
+        """
+        connector = self.resource.slug
+        series = self.series()
+        keys = []
+        for route, status in series:
+            prefix = self.series_prefix(route, status)
+            keys.extend(f"{prefix}-bucket-{index}" for index in range(len(DURATION_BUCKETS)))
+            keys.extend([f"{prefix}-bucket-inf", f"{prefix}-count", f"{prefix}-sum-ms"])
+        for name, results in CACHE_RESULTS.items():
+            keys.extend(f"{self.prefix}-cache-{name}-{result}" for result in results)
+        keys.extend([breaker.failures_key, breaker.open_key])
+        values = cache.get_many(keys)
+
+        lines = [
+            "# HELP atal_request_duration_seconds Durée des appels à ATAL.",
+            "# TYPE atal_request_duration_seconds histogram",
+        ]
+        for route, status in series:
+            prefix = self.series_prefix(route, status)
+            cumulative = 0
+            for index, bound in enumerate(DURATION_BUCKETS):
+                cumulative += values.get(f"{prefix}-bucket-{index}", 0)
+                labels = _labels(connector=connector, route=route, status=status, le=bound)
+                lines.append(f"atal_request_duration_seconds_bucket{labels} {cumulative}")
+            cumulative += values.get(f"{prefix}-bucket-inf", 0)
+            labels = _labels(connector=connector, route=route, status=status, le="+Inf")
+            lines.append(f"atal_request_duration_seconds_bucket{labels} {cumulative}")
+            labels = _labels(connector=connector, route=route, status=status)
+            lines.append(f"atal_request_duration_seconds_sum{labels} {values.get(f'{prefix}-sum-ms', 0) / 1000}")
+            lines.append(f"atal_request_duration_seconds_count{labels} {values.get(f'{prefix}-count', 0)}")
+
+        lines += [
+            "# HELP atal_cache_requests_total Lectures des caches du connecteur, par résultat.",
+            "# TYPE atal_cache_requests_total counter",
+        ]
+        for name, results in CACHE_RESULTS.items():
+            for result in results:
+                labels = _labels(connector=connector, cache=name, result=result)
+                lines.append(
+                    f"atal_cache_requests_total{labels} {values.get(f'{self.prefix}-cache-{name}-{result}', 0)}"
+                )
+
+        open_until = values.get(breaker.open_key)
+        if open_until is None:
+            state = 0
+        elif time.time() < open_until:
+            state = 1
+        else:
+            state = 2
+        lines += [
+            "# HELP atal_circuit_breaker_state État du disjoncteur (0 fermé, 1 ouvert, 2 semi-ouvert).",
+            "# TYPE atal_circuit_breaker_state gauge",
+            f"atal_circuit_breaker_state{_labels(connector=connector)} {state}",
+            "# HELP atal_circuit_breaker_failures Échecs consécutifs des appels à ATAL.",
+            "# TYPE atal_circuit_breaker_failures gauge",
+            f"atal_circuit_breaker_failures{_labels(connector=connector)} {values.get(breaker.failures_key, 0)}",
+        ]
+        return "\n".join(lines) + "\n"
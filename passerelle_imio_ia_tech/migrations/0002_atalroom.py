@@ -0,0 +1,51 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AtalRoom",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("atal_id", models.IntegerField()),
+                ("parent_id", models.IntegerField(null=True)),
+                ("type", models.IntegerField(null=True)),
+                ("position", models.PositiveIntegerField(default=0)),
+                ("data", models.JSONField(default=dict)),
+                (
+                    "resource",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rooms",
+                        to="passerelle_imio_ia_tech.imio_atal",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["position"],
+                "unique_together": {("resource", "atal_id")},
+            },
+        ),
+        migrations.AddIndex(
+            model_name="atalroom",
+            index=models.Index(fields=["resource", "parent_id"], name="atal_room_resource_parent_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="atalroom",
+            index=models.Index(fields=["resource", "type"], name="atal_room_resource_type_idx"),
+        ),
+    ]
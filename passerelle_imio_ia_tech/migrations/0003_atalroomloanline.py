@@ -0,0 +1,69 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0002_atalroom"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imio_atal",
+            name="loans_mirror_max_age",
+            field=models.PositiveIntegerField(
+                default=15,
+                help_text=(
+                    "Les disponibilités des salles sont calculées à partir d'une copie locale des locations, "
+                    "mise à jour toutes les 5 minutes. Au-delà de cet âge, les locations sont lues dans ATAL. "
+                    "0 désactive la copie locale."
+                ),
+                verbose_name="Âge maximum du miroir des locations (minutes)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="imio_atal",
+            name="loans_mirror_synced",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name="AtalRoomLoanLine",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("atal_id", models.IntegerField()),
+                ("room_id", models.IntegerField(null=True)),
+                ("start_date", models.DateTimeField()),
+                ("end_date", models.DateTimeField()),
+                ("data", models.JSONField(default=dict)),
+                (
+                    "resource",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="room_loan_lines",
+                        to="passerelle_imio_ia_tech.imio_atal",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["atal_id"],
+                "unique_together": {("resource", "atal_id")},
+            },
+        ),
+        migrations.AddIndex(
+            model_name="atalroomloanline",
+            index=models.Index(fields=["resource", "room_id", "start_date"], name="atal_loan_line_room_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="atalroomloanline",
+            index=models.Index(fields=["resource", "start_date", "end_date"], name="atal_loan_line_dates_idx"),
+        ),
+    ]
@@ -0,0 +1,39 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0003_atalroomloanline"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AtalRoomHold",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("room_id", models.IntegerField()),
+                ("expires", models.DateTimeField()),
+                (
+                    "resource",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="room_holds",
+                        to="passerelle_imio_ia_tech.imio_atal",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("resource", "room_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0004_atalroomhold"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imio_atal",
+            name="http_pool_size",
+            field=models.PositiveIntegerField(
+                default=10,
+                help_text="Nombre maximum de connexions gardées ouvertes vers ATAL par processus.",
+                verbose_name="Connexions HTTP vers ATAL",
+            ),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0005_imio_atal_http_pool_size"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imio_atal",
+            name="patrimonies_cache_ttl",
+            field=models.PositiveIntegerField(
+                default=60,
+                help_text="Passé ce délai, la réponse est revalidée auprès d'ATAL. 0 désactive le cache.",
+                verbose_name="Durée de cache du patrimoine louable (minutes)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="imio_atal",
+            name="thematics_cache_ttl",
+            field=models.PositiveIntegerField(
+                default=60,
+                help_text="Passé ce délai, la réponse est revalidée auprès d'ATAL. 0 désactive le cache.",
+                verbose_name="Durée de cache des thématiques (minutes)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="imio_atal",
+            name="third_parties_cache_ttl",
+            field=models.PositiveIntegerField(
+                default=60,
+                help_text="Passé ce délai, la réponse est revalidée auprès d'ATAL. 0 désactive le cache.",
+                verbose_name="Durée de cache des tiers (minutes)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="imio_atal",
+            name="features_cache_ttl",
+            field=models.PositiveIntegerField(
+                default=60,
+                help_text="Passé ce délai, la réponse est revalidée auprès d'ATAL. 0 désactive le cache.",
+                verbose_name="Durée de cache des features (minutes)",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0006_imio_atal_cache_ttl"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imio_atal",
+            name="reference_stale_max_age",
+            field=models.PositiveIntegerField(
+                default=1440,
+                help_text=(
+                    "Passé leur durée de cache, le patrimoine, les thématiques, les tiers et les features "
+                    "restent servis immédiatement jusqu'à cet âge, pendant qu'ils sont rafraîchis en "
+                    "arrière-plan. Au-delà, la requête attend la réponse d'ATAL. 0 désactive ce mode."
+                ),
+                verbose_name="Âge maximum des données de référence périmées (minutes)",
+            ),
+        ),
+    ]
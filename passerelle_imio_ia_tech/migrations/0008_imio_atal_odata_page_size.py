@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0007_imio_atal_reference_stale_max_age"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imio_atal",
+            name="odata_page_size",
+            field=models.PositiveIntegerField(
+                default=500,
+                help_text=(
+                    "Les locations et le matériel inventorié sont lus par pages de cette taille. "
+                    "0 lit chaque liste en un seul appel."
+                ),
+                verbose_name="Taille des pages des listes ATAL",
+            ),
+        ),
+    ]
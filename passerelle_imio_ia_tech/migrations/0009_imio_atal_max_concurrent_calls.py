@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0008_imio_atal_odata_page_size"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imio_atal",
+            name="max_concurrent_calls",
+            field=models.PositiveIntegerField(
+                default=4,
+                help_text=(
+                    "Nombre maximum d'appels indépendants envoyés en même temps à ATAL par un endpoint "
+                    "(réservations de plusieurs plages horaires, pièces jointes d'une salle)."
+                ),
+                verbose_name="Appels simultanés vers ATAL",
+            ),
+        ),
+    ]
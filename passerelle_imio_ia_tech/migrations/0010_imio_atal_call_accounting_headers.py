@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0009_imio_atal_max_concurrent_calls"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imio_atal",
+            name="call_accounting_headers",
+            field=models.BooleanField(
+                default=False,
+                help_text=(
+                    "Ajoute aux réponses des endpoints le nombre d'appels faits à ATAL et le temps passé "
+                    "à l'attendre. Ces informations sont toujours inscrites dans le journal du connecteur."
+                ),
+                verbose_name="En-têtes X-Atal-Calls et Server-Timing",
+            ),
+        ),
+    ]
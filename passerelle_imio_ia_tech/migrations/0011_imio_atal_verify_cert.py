@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0010_imio_atal_call_accounting_headers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imio_atal",
+            name="verify_cert",
+            field=models.BooleanField(
+                default=False,
+                help_text="Vérifie le certificat TLS d'ATAL. À décocher si le service n'a pas de certificat valide.",
+                verbose_name="Vérification du certificat",
+            ),
+        ),
+    ]
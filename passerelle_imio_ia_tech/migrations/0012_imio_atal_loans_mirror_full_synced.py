@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0011_imio_atal_verify_cert"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imio_atal",
+            name="loans_mirror_full_synced",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name="imio_atal",
+            name="loans_mirror_max_age",
+            field=models.PositiveIntegerField(
+                default=15,
+                help_text=(
+                    "Les disponibilités des salles sont calculées à partir d'une copie locale des locations, "
+                    "relue entièrement toutes les 5 minutes. Au-delà de cet âge depuis la dernière relecture "
+                    "complète, les locations sont lues dans ATAL. 0 désactive la copie locale."
+                ),
+                verbose_name="Âge maximum du miroir des locations (minutes)",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0012_imio_atal_loans_mirror_full_synced"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="imio_atal",
+            name="max_concurrent_calls",
+            field=models.PositiveIntegerField(
+                default=4,
+                help_text=(
+                    "Nombre maximum d'appels indépendants envoyés en même temps à ATAL par le connecteur, "
+                    "tous endpoints confondus, dans chaque processus (réservations de plusieurs plages "
+                    "horaires, pièces jointes d'une salle)."
+                ),
+                verbose_name="Appels simultanés vers ATAL",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("passerelle_imio_ia_tech", "0013_imio_atal_max_concurrent_calls_per_connector"),
+    ]
+
+    operations = [
+        # les connecteurs existants gardent la valeur donnée par 0011 (pas de vérification)
+        migrations.AlterField(
+            model_name="imio_atal",
+            name="verify_cert",
+            field=models.BooleanField(
+                default=True,
+                help_text=(
+                    "Vérifie le certificat TLS d'ATAL. À décocher seulement si le service n'a pas de certificat valide."
+                ),
+                verbose_name="Vérification du certificat",
+            ),
+        ),
+    ]
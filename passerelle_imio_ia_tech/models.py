@@ -1,16 +1,27 @@
 import base64
+import contextlib
 import datetime
+import functools
+import itertools
 from datetime import tzinfo
-from zoneinfo import ZoneInfo
 import json
 import mimetypes
+import re
+import threading
 import time
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
-import requests
+from django.db import IntegrityError
+from django.db import connections
 from django.db import models
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.conf import settings
+from django.core.cache import cache
 from django.http import JsonResponse
 from django.http import HttpResponse
 
@@ -19,21 +30,24 @@ from passerelle.base.models import BaseResource
 from passerelle.base.signature import sign_url
 from passerelle.utils.api import endpoint
 from passerelle.utils.jsonresponse import APIError
-from requests import RequestException
 
+from . import availability
+from .client import AtalClient
+from .client import current_invocation
+from .client import instrument_endpoints
+from .client import invocation_scope
+from .availability import ATAL_TIMEZONE
+from .availability import string_to_aware_datetime
+from .availability import string_to_epoch_minutes
+from .rooms import RoomHierarchy
 
-# TODO : we should rename this class name with something like AtalConnector
-def string_to_datetime(date_string):
-    """
-    convertit les dates string de ATAL en datetime
-    :param date_string: string d'une date au format 2000-12-31T23:59...
-    :return: datetime(year, month, day, hour, minute)
-    """
-    # string de formatage pour strptime
-    format_datetime = "%Y-%m-%dT%H:%M"
-
-    return datetime.datetime.strptime(date_string[:16], format_datetime)
+# appels simultanés de fan_out par connecteur, partagés par les threads du processus :
+# max_concurrent_calls borne le connecteur et non chaque appel d'endpoint
+_call_slots = {}
+_call_slots_lock = threading.Lock()
 
+# thread de fan_out en cours d'appel, qui occupe déjà une place
+_fan_out_local = threading.local()
 
 # Signatures binaires des formats renvoyés par ATAL, utilisées en dernier recours
 # quand ni l'en-tête HTTP ni le nom du fichier ne donnent de type exploitable.
@@ -81,6 +95,8 @@ def guess_content_type_from_content(content):
     return None
 
 
+# TODO : we should rename this class name with something like AtalConnector
+@instrument_endpoints
 class imio_atal(BaseResource):
     """Connecteur permettant d'intéragir avec une instance d'ATAL V6"""
 
@@ -94,6 +110,85 @@ class imio_atal(BaseResource):
         max_length=128,
         verbose_name="API Key",
     )
+    loans_mirror_max_age = models.PositiveIntegerField(
+        default=15,
+        verbose_name="Âge maximum du miroir des locations (minutes)",
+        help_text=(
+            "Les disponibilités des salles sont calculées à partir d'une copie locale des locations, "
+            "relue entièrement toutes les 5 minutes. Au-delà de cet âge depuis la dernière relecture "
+            "complète, les locations sont lues dans ATAL. 0 désactive la copie locale."
+        ),
+    )
+    # dernière mise à jour du miroir, complète ou limitée aux nouvelles lignes
+    loans_mirror_synced = models.DateTimeField(null=True, editable=False)
+    # dernière relecture complète : seule celle-ci voit les locations modifiées ou supprimées
+    loans_mirror_full_synced = models.DateTimeField(null=True, editable=False)
+    verify_cert = models.BooleanField(
+        default=True,
+        verbose_name="Vérification du certificat",
+        help_text=(
+            "Vérifie le certificat TLS d'ATAL. À décocher seulement si le service n'a pas de certificat valide."
+        ),
+    )
+    http_pool_size = models.PositiveIntegerField(
+        default=10,
+        verbose_name="Connexions HTTP vers ATAL",
+        help_text="Nombre maximum de connexions gardées ouvertes vers ATAL par processus.",
+    )
+    patrimonies_cache_ttl = models.PositiveIntegerField(
+        default=60,
+        verbose_name="Durée de cache du patrimoine louable (minutes)",
+        help_text="Passé ce délai, la réponse est revalidée auprès d'ATAL. 0 désactive le cache.",
+    )
+    thematics_cache_ttl = models.PositiveIntegerField(
+        default=60,
+        verbose_name="Durée de cache des thématiques (minutes)",
+        help_text="Passé ce délai, la réponse est revalidée auprès d'ATAL. 0 désactive le cache.",
+    )
+    third_parties_cache_ttl = models.PositiveIntegerField(
+        default=60,
+        verbose_name="Durée de cache des tiers (minutes)",
+        help_text="Passé ce délai, la réponse est revalidée auprès d'ATAL. 0 désactive le cache.",
+    )
+    features_cache_ttl = models.PositiveIntegerField(
+        default=60,
+        verbose_name="Durée de cache des features (minutes)",
+        help_text="Passé ce délai, la réponse est revalidée auprès d'ATAL. 0 désactive le cache.",
+    )
+    max_concurrent_calls = models.PositiveIntegerField(
+        default=4,
+        verbose_name="Appels simultanés vers ATAL",
+        help_text=(
+            "Nombre maximum d'appels indépendants envoyés en même temps à ATAL par le connecteur, "
+            "tous endpoints confondus, dans chaque processus (réservations de plusieurs plages "
+            "horaires, pièces jointes d'une salle)."
+        ),
+    )
+    call_accounting_headers = models.BooleanField(
+        default=False,
+        verbose_name="En-têtes X-Atal-Calls et Server-Timing",
+        help_text=(
+            "Ajoute aux réponses des endpoints le nombre d'appels faits à ATAL et le temps passé "
+            "à l'attendre. Ces informations sont toujours inscrites dans le journal du connecteur."
+        ),
+    )
+    odata_page_size = models.PositiveIntegerField(
+        default=500,
+        verbose_name="Taille des pages des listes ATAL",
+        help_text=(
+            "Les locations et le matériel inventorié sont lus par pages de cette taille. "
+            "0 lit chaque liste en un seul appel."
+        ),
+    )
+    reference_stale_max_age = models.PositiveIntegerField(
+        default=24 * 60,
+        verbose_name="Âge maximum des données de référence périmées (minutes)",
+        help_text=(
+            "Passé leur durée de cache, le patrimoine, les thématiques, les tiers et les features "
+            "restent servis immédiatement jusqu'à cet âge, pendant qu'ils sont rafraîchis en "
+            "arrière-plan. Au-delà, la requête attend la réponse d'ATAL. 0 désactive ce mode."
+        ),
+    )
     api_description = "Connecteur permettant d'intéragir avec une instance d'ATAL V6"
     category = "Connecteurs iMio"
 
@@ -112,9 +207,44 @@ class imio_atal(BaseResource):
         "backoff_factor": 0.5,
     }
 
+    # Délai d'attente de chaque route ATAL, calculé sur les adaptive_timeout_samples derniers
+    # appels de la route : 99e centile x adaptive_timeout_factor, entre adaptive_timeout_floor
+    # et adaptive_timeout_ceiling secondes. requests_timeout s'applique tant que la route a
+    # moins de adaptive_timeout_min_samples mesures. /api/Test échoue ainsi en quelques
+    # secondes, un $expand lent sur /api/Patrimonies garde sa marge.
+    adaptive_timeout_samples = 200
+    adaptive_timeout_min_samples = 20
+    adaptive_timeout_factor = 3
+    adaptive_timeout_floor = 3
+    adaptive_timeout_ceiling = 60
+
+    # Disjoncteur : après ce nombre d'échecs consécutifs (erreur réseau, délai dépassé ou
+    # réponse 5xx), les appels à ATAL échouent immédiatement pendant
+    # circuit_breaker_reset_timeout secondes, puis un seul appel d'essai est tenté. Sans
+    # cela, un ATAL hors service occupe chaque worker jusqu'à 3 x 25 secondes par appel.
+    circuit_breaker_threshold = 5
+    circuit_breaker_reset_timeout = 30
+
+    # Durée maximum, en secondes, du blocage local d'une salle pendant l'inscription d'une
+    # réservation ; au-delà, le blocage d'un worker interrompu est ignoré.
+    room_hold_timeout = 60
+
+    # Durée de vie en cache des tableaux d'occupation des salles, en secondes. Les
+    # réservations passant par ce connecteur les invalident immédiatement, cette durée
+    # borne le retard sur les réservations encodées directement dans ATAL.
+    occupancy_cache_timeout = 300
+
+    # Nombre maximum de jours d'une grille de disponibilité (generate-availability-matrix)
+    # selon sa granularité : la réponse compte un drapeau par salle et par heure ou par jour.
+    matrix_max_days = {"hour": 31, "day": 366}
+
     class Meta:
         verbose_name = "Connecteur ATAL (iMio)"
 
+    @cached_property
+    def atal(self):
+        return AtalClient(self)
+
     @endpoint(
         perm="can_access",
         description="Méthode de test",
@@ -123,16 +253,28 @@ class imio_atal(BaseResource):
         display_category="Test",
     )
     def test(self, request=None):
-        atal_response = self.requests.get(
-            f"{self.base_url}/api/Test",
-            headers={"Accept": "text/plain", "X-API-Key": self.api_key},
-            verify=False,
-        )
+        atal_response = self.atal.request("GET", "/api/Test", accept="text/plain", raise_for_status=False)
         atal_response_format = "{} - {}".format(
             atal_response.status_code, atal_response.text
         )
         return atal_response_format
 
+    @endpoint(
+        perm="can_access",
+        description="Métriques du connecteur",
+        long_description=(
+            "Durée des appels à ATAL par route et par statut, lectures des caches et état du "
+            "disjoncteur, au format texte de Prometheus."
+        ),
+        display_order=1,
+        display_category="Test",
+    )
+    def metrics(self, request):
+        return HttpResponse(
+            self.atal.metrics.render(self.atal.breaker),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+
     @endpoint(
         name="third-parties",
         perm="can_access",
@@ -141,12 +283,9 @@ class imio_atal(BaseResource):
         display_category="Utilitaires",
     )
     def third_parties(self, request):
-        response = self.requests.get(
-            f"{self.base_url}/api/ThirdParties?type=2",
-            headers={"Accept": "application/json", "X-API-Key": self.api_key},
-            verify=False,
+        r_json = self.get_reference_data(
+            "/api/ThirdParties", self.third_parties_cache_ttl, params={"type": 2}, raise_for_status=False
         )
-        r_json = response.json()
         r_json = sorted(r_json, key=lambda i: i["Name"])
         return {"data": r_json}
 
@@ -182,18 +321,9 @@ class imio_atal(BaseResource):
         }
         # TODO : Use schemas as Entr'Ouvert does
 
-        response = self.requests.post(
-            f"{self.base_url}/api/WorksRequests",
-            json=data_to_atal,
-            headers={
-                "accept": "application/json",
-                "X-API-Key": self.api_key,
-                "Content-Type": "application/json",
-            },
-            verify=False,
-        )
+        response = self.atal.post("/api/WorksRequests", json=data_to_atal, raise_for_status=False)
 
-        return {"data": response.json()}
+        return {"data": response}
 
     @endpoint(
         perm="can_access",
@@ -212,9 +342,6 @@ class imio_atal(BaseResource):
         image_for_atal = BytesIO(decoded_image)
         # uuid is fetched from ATAL work request creation response in wcs vars
         work_request_uuid = post_data["atal_work_request_uuid"]
-        headers = {
-            "X-API-Key": self.api_key,
-        }
         # multipart/formdata http request specific syntax
         files = {
             "file": (
@@ -223,14 +350,13 @@ class imio_atal(BaseResource):
                 post_data["atal_attachment1"]["content_type"],
             )
         }
-        response = self.requests.post(
-            f"{self.base_url}/api/WorksRequests/{work_request_uuid}/Attachments",
-            headers=headers,
+        response = self.atal.post(
+            f"/api/WorksRequests/{work_request_uuid}/Attachments",
             files=files,
-            verify=False,
+            raise_for_status=False,
         )
 
-        return {"data": response.json()}  # must return dict
+        return {"data": response}  # must return dict
 
     # TODO: Delete this one and use read_work_request_details instead
     @endpoint(
@@ -254,31 +380,17 @@ class imio_atal(BaseResource):
     def get_work_request_details(self, request, *args, **kwargs):
         post_data = json.loads(request.body)  # http data from wcs webservice
         uuid = post_data["atal_work_request_uuid"]
-        url = f"{self.base_url}/api/WorksRequests/{uuid}"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
+        path = f"/api/WorksRequests/{uuid}"
 
         params = {
             "$expand": "Responses",
         }
 
-        log_requests_errors = False
-        response = self.requests.get(
-            url,
-            params=params,
-            headers=headers,
-            verify=False,
-        )
-
-        response_json = response.json()
-        log_requests_errors = True
+        response_json = self.atal.get(path, params=params, raise_for_status=False)
 
         # Make it work anyway when ATAL isn't up to date (if Responses expand does not work)
         if response_json.get("detail") and "Responses" in response_json.get("detail"):
-            response = self.requests.get(url, headers=headers, verify=False)
-            response_json = response.json()
+            response_json = self.atal.get(path, raise_for_status=False)
 
         return {"data": response_json}  # must return dict
 
@@ -306,18 +418,9 @@ class imio_atal(BaseResource):
         display_category="Demandes de travaux",
     )
     def read_work_request_details(self, request, uuid):
-        url = f"{self.base_url}/api/WorksRequests/{uuid}"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-        response = self.requests.get(
-            url,
-            headers=headers,
-            verify=False,
-        )
+        response = self.atal.get(f"/api/WorksRequests/{uuid}", raise_for_status=False)
 
-        return {"data": response.json()}  # must return dict
+        return {"data": response}  # must return dict
 
     ###################
     ### Patrimoines ###
@@ -346,31 +449,34 @@ class imio_atal(BaseResource):
                 "description": "Triage du résultat",
                 "type": "string",
                 "example_value": "Id",
-            }
+            },
+            "select": {
+                "description": "Champs gardés dans chaque patrimoine, séparés par des virgules",
+                "type": "string",
+                "example_value": "Id,Name,FeaturesValues",
+            },
+            "limit": {
+                "description": "Nombre maximum de patrimoines renvoyés",
+                "type": "int",
+                "example_value": 100,
+            },
         },
     )
-    def read_patrimonies(self, request, expands=None, filters=None, orderby=None):
-        url = f"{self.base_url}/api/Patrimonies"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-
+    def read_patrimonies(self, request, expands=None, filters=None, orderby=None, select=None, limit=None):
         params = {
             "$expand": expands,
             "$filter": filters,
             "$orderby": orderby,
         }
+        fields = None
+        if select:
+            params["$select"] = select
+            fields = {field.strip() for field in select.split(",")}
 
-        response = self.requests.get(
-            url,
-            headers=headers,
-            params=params,
-            verify=False,
-        )
-        response.raise_for_status()
-
-        return response.json()
+        # les patrimoines étendus peuvent peser des dizaines de Mo : ils sont lus un par un
+        # et seuls les champs demandés sont gardés
+        patrimonies = self.atal.iter_json("/api/Patrimonies", params=params, fields=fields)
+        return list(itertools.islice(patrimonies, self.parse_limit(limit)))
 
     #########################
     ### Location de Salles###
@@ -384,25 +490,29 @@ class imio_atal(BaseResource):
         display_category="Location de Salles",
         display_order=1,
         methods=["get"],
+        parameters={
+            "filters": {
+                "description": "Suite du filtre OData, ajoutée après CanBeLoaned",
+                "type": "string",
+                "example_value": "and Type eq 1",
+            },
+            "select": {
+                "description": (
+                    "Champs renvoyés par ATAL ($select), séparés par des virgules. "
+                    "Par défaut, tous les champs."
+                ),
+                "type": "string",
+                "example_value": "Id,Name,Type,ParentId",
+            },
+        },
     )
-    def read_patrimoines_louable(self, request, filters=None):
-        url = f"{self.base_url}/api/Patrimonies"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-
+    def read_patrimoines_louable(self, request, filters=None, select=None):
         params = {"$filter": f"CanBeLoaned {filters}" if filters else "CanBeLoaned"}
+        if select:
+            params["$select"] = select
 
-        response = self.requests.get(
-            url,
-            headers=headers,
-            params=params,
-            verify=False,
-        )
-        response.raise_for_status()
-
-        return response.json()  # must return dict
+        # must return dict
+        return self.get_reference_data("/api/Patrimonies", self.patrimonies_cache_ttl, params=params)
 
     @endpoint(
         name="get-rooms-name",
@@ -412,12 +522,23 @@ class imio_atal(BaseResource):
         display_category="Location de Salles",
         display_order=2,
         methods=["get"],
+        parameters={
+            "select": {
+                "description": (
+                    "Champs renvoyés par ATAL ($select), séparés par des virgules. "
+                    "Par défaut, tous les champs."
+                ),
+                "type": "string",
+                "example_value": "Id,Name",
+            },
+        },
     )
-    def read_rooms_name(self, request):
-        # liste de tous le patrimoine louable
-        patrimoines = self.read_patrimoines_louable(request)
+    def read_rooms_name(self, request, select=None):
+        # salles (type 1) du patrimoine louable, filtrées par ATAL
+        if select and "Type" not in select.split(","):
+            select = f"{select},Type"
+        patrimoines = self.read_patrimoines_louable(request, filters="and Type eq 1", select=select)
 
-        # tri en fonction du type 1 (salle)
         return {
             "data": [x for x in patrimoines if "Type" in x and x["Type"] == 1]
         }  # must return dict
@@ -432,13 +553,11 @@ class imio_atal(BaseResource):
         methods=["get"],
     )
     def read_parents_rooms(self, request):
-        # liste des salles louables
-        rooms_name = self.read_rooms_name(request)["data"]
-
-        ids = {room["Id"] for room in rooms_name}  # Ensemble de tous les Ids
-        parent_rooms = [room for room in rooms_name if "ParentId" not in room or room["ParentId"] not in ids]
+        # salles louables dont le parent n'est pas une salle louable
+        rooms = self.get_rooms()
+        parent_rooms = rooms.filter(type=1).exclude(parent_id__in=rooms.filter(type=1).values("atal_id"))
 
-        return {"data": parent_rooms}
+        return {"data": [room.data for room in parent_rooms]}
 
     @endpoint(
         name="get-kids-rooms",
@@ -457,11 +576,9 @@ class imio_atal(BaseResource):
         },
     )
     def read_kids_rooms(self, request, parent_id):
-        # liste des salles louables
-        rooms_name = self.read_rooms_name(request)["data"]
-        kids_rooms = [room for room in rooms_name if room.get("ParentId") == parent_id]
+        kids_rooms = self.get_rooms().filter(type=1, parent_id=parent_id)
 
-        return {"data": kids_rooms}
+        return {"data": [room.data for room in kids_rooms]}
 
     @endpoint(
         name="get-room",
@@ -485,25 +602,11 @@ class imio_atal(BaseResource):
         },
     )
     def read_room(self, request, room_id, expands=None):
-        url = f"{self.base_url}/api/Patrimonies/{room_id}"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-
         params = {
             "$expand": expands,
         } if expands else None
 
-        response = self.requests.get(
-            url,
-            headers=headers,
-            params=params,
-            verify=False,
-        )
-        response.raise_for_status()
-
-        return response.json()  # must return dict
+        return self.atal.get(f"/api/Patrimonies/{room_id}", params=params)  # must return dict
 
     @endpoint(
         name="get-room-loans",
@@ -513,23 +616,16 @@ class imio_atal(BaseResource):
         long_description="Cherche les locations de salles dans ATAL.",
         display_category="Location de Salles",
         display_order=6,
+        parameters={
+            "limit": {
+                "description": "Nombre maximum d'éléments renvoyés",
+                "type": "int",
+                "example_value": 100,
+            },
+        },
     )
-    def read_reservations_room(self, request):
-        url = f"{self.base_url}/api/RoomLoans"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-
-        response = self.requests.get(
-            url,
-            headers=headers,
-            verify=False,
-        )
-
-        response.raise_for_status()
-
-        return response.json()  # must return dict
+    def read_reservations_room(self, request, limit=None):
+        return self.read_collection("/api/RoomLoans", limit=limit)  # must return dict
 
     @endpoint(
         name="get-reservation-room",
@@ -548,20 +644,7 @@ class imio_atal(BaseResource):
         },
     )
     def read_reservation_room(self, request, id):
-        url = f"{self.base_url}/api/RoomLoans/{id}"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-        response = self.requests.get(
-            url,
-            headers=headers,
-            verify=False,
-        )
-
-        response.raise_for_status()
-
-        return {"data": response.json()}  # must return dict
+        return {"data": self.atal.get(f"/api/RoomLoans/{id}")}  # must return dict
 
     @endpoint(
         name="get-reservation-room-detail",
@@ -573,21 +656,9 @@ class imio_atal(BaseResource):
         display_order=8,
     )
     def read_reservations_room_details(self, request, filters=None):
-        url = f"{self.base_url}/api/RoomLoans/Lines"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
         params = {"$filter": filters} if filters else None
-        response = self.requests.get(
-            url,
-            headers=headers,
-            params=params,
-            verify=False,
-        )
-        response.raise_for_status()
 
-        return response.json()  # must return dict
+        return self.atal.get("/api/RoomLoans/Lines", params=params)  # must return dict
 
     @endpoint(
         name="get-rooms-dispo",
@@ -629,38 +700,30 @@ class imio_atal(BaseResource):
         datetime_debut = datetime.datetime.strptime(datetime_debut, format_date)
         datetime_fin = datetime.datetime.strptime(datetime_fin, format_date)
         # TimeZone
-        timezone = ZoneInfo("Europe/Brussels")
-        datetime_debut = datetime_debut.replace(tzinfo=timezone)
-        datetime_fin = datetime_fin.replace(tzinfo=timezone)
-        # ISO format
-        datetime_debut = datetime_debut.isoformat()
-        datetime_fin = datetime_fin.isoformat()
+        datetime_debut = datetime_debut.replace(tzinfo=ATAL_TIMEZONE)
+        datetime_fin = datetime_fin.replace(tzinfo=ATAL_TIMEZONE)
 
         # query pour les locations
-        query = f"(StartDate lt {datetime_fin}) and (EndDate gt {datetime_debut})"
+        query = f"(StartDate lt {datetime_fin.isoformat()}) and (EndDate gt {datetime_debut.isoformat()})"
 
         # liste des locations
-        liste_location = self.read_reservations_room_details(request, filters=query)
+        liste_location = self.get_room_loan_lines(
+            request, query, start_date__lt=datetime_fin, end_date__gt=datetime_debut
+        )
 
-        # init liste rooms non dispo
-        room_non_dispo = [location.get("RoomId") for location in liste_location]
-        # suppression des doublons
-        room_non_dispo = list(set(room_non_dispo))
+        # arborescence du patrimoine louable, lue une seule fois pour toutes les salles occupées
+        hierarchy = RoomHierarchy([room.data for room in self.get_rooms()])
+
+        # salles occupées, sans doublons
+        room_non_dispo = {int(location["RoomId"]) for location in liste_location if location.get("RoomId") is not None}
         # Check parents/kids
-        room_parents_kids_non_dispo = []
+        room_parents_kids_non_dispo = set()
         for room in room_non_dispo:
-            room = int(room)
-            room_parents_kids_non_dispo.extend(self.get_rooms_for_indisponibilities(request, room))
-
-        # suppression des doublons
-        room_parents_kids_non_dispo = list(set(room_parents_kids_non_dispo))
-
-        # liste des salles
-        rooms = self.read_rooms_name(request)["data"]
+            room_parents_kids_non_dispo.update(self.get_rooms_for_indisponibilities(request, room, hierarchy))
 
         # tri des salles pour avoir les dispo
         return {
-            "data": [x for x in rooms if int(x["Id"]) not in room_parents_kids_non_dispo]
+            "data": [x for x in hierarchy.rooms if int(x["Id"]) not in room_parents_kids_non_dispo]
         }  # must return dict
 
     @endpoint(
@@ -690,14 +753,21 @@ class imio_atal(BaseResource):
 
         start_date = today + datetime.timedelta(days=delai)
 
-        query = filters if filters else None
-
         start_string = start_date.strftime("%Y-%m-%d")
-
-        query = query + f" and StartDate ge {start_string}" if query else f"StartDate ge {start_string}"
+        lookups = {"start_date__gte": start_date.replace(tzinfo=ATAL_TIMEZONE)}
+        if filters:
+            # parenthèses : le filtre sur la date doit s'appliquer à toutes les salles
+            query = f"({filters}) and StartDate ge {start_string}"
+            rooms = self.parse_room_filter(filters)
+            if rooms is None:
+                # filtre sans équivalent dans le miroir local
+                return {"data": self.read_reservations_room_details(request, filters=query)}
+            lookups["room_id__in"] = rooms
+        else:
+            query = f"StartDate ge {start_string}"
 
         # liste des locations
-        locations = self.read_reservations_room_details(request, filters=query)
+        locations = self.get_room_loan_lines(request, query, **lookups)
 
         return {"data": locations}
 
@@ -725,33 +795,53 @@ class imio_atal(BaseResource):
                 "type": "int",
                 "example_value": 365,
             },
+            "format": {
+                "description": (
+                    "slots (défaut) : une entrée par créneau ; ranges : créneaux consécutifs de même "
+                    "disponibilité regroupés ; bitmap : un bit par créneau (1 = indisponible) en base64"
+                ),
+                "type": "string",
+                "example_value": "ranges",
+            },
+            "date_from": {
+                "description": (
+                    "premier jour de la période demandée ; si renseigné, remplace start et end "
+                    "et seules les locations de la période sont lues"
+                ),
+                "type": "datetime.date",
+                "example_value": "2026-11-01",
+            },
+            "days": {
+                "description": "nombre de jours de la période commençant à date_from",
+                "type": "int",
+                "example_value": 7,
+            },
         },
     )
-    def generate_day_availability(self, request, room, start=0, end=365):
+    def generate_day_availability(self, request, room, start=0, end=365, format="slots", date_from=None, days=7):
+        if format not in availability.AVAILABILITY_FORMATS:
+            raise APIError(f"format must be one of {', '.join(availability.AVAILABILITY_FORMATS)}")
+
         rooms = self.get_rooms_for_indisponibilities(request, room)
 
-        indisponibilites = self.get_indisponibilities(request, rooms, start)
-
-        start_date = datetime.date.today() + datetime.timedelta(days=start)
-        end_date = datetime.date.today() + datetime.timedelta(days=end)
-        delta = end_date - start_date
-        days = [start_date + datetime.timedelta(days=x) for x in range(delta.days + 1)]
-        free_days = []
-        for day in days:
-            text = day.strftime("%d/%m/%Y")
-            id = day.strftime("%Y-%m-%d")
-            start_date = day.strftime("%Y-%m-%d")
-            end_date = day.strftime("%Y-%m-%d")
-            start_time = "00:00"
-            end_time = "23:59"
-            disabled = True in [
-                string_to_datetime(x["StartDate"]).date() <= day <= string_to_datetime(x["EndDate"]).date()
-                for x in indisponibilites
-            ]
-            free_days.append(
-                {"text": text, "id": id, "start_date": start_date, "end_date": end_date, "start_time": start_time,
-                 "end_time": end_time, "disabled": disabled})
-        return {"data": free_days}
+        if date_from:
+            start_date, end_date = self.parse_availability_window(date_from, days)
+        else:
+            start_date = datetime.date.today() + datetime.timedelta(days=start)
+            end_date = datetime.date.today() + datetime.timedelta(days=end)
+        window = availability.days_between(start_date, end_date)
+
+        if date_from:
+            indisponibilites = self.get_window_indisponibilities(request, rooms, start_date, end_date)
+            flags = availability.day_flags(indisponibilites, window)
+        elif 0 <= start <= end < availability.OCCUPANCY_DAYS:
+            flags = self.get_occupancy(request, rooms).day_flags(start_date, len(window))
+        else:
+            # période non couverte par les tableaux d'occupation
+            indisponibilites = self.get_indisponibilities(request, rooms, start)
+            flags = availability.day_flags(indisponibilites, window)
+
+        return self.availability_response(window, flags, availability.day_slot, format, end_date)
 
     @endpoint(
         name="generate-hour-availability",
@@ -777,40 +867,148 @@ class imio_atal(BaseResource):
                 "type": "int",
                 "example_value": 365,
             },
+            "format": {
+                "description": (
+                    "slots (défaut) : une entrée par créneau ; ranges : créneaux consécutifs de même "
+                    "disponibilité regroupés ; bitmap : un bit par créneau (1 = indisponible) en base64"
+                ),
+                "type": "string",
+                "example_value": "ranges",
+            },
+            "date_from": {
+                "description": (
+                    "premier jour de la période demandée ; si renseigné, remplace start et end "
+                    "et seules les locations de la période sont lues"
+                ),
+                "type": "datetime.date",
+                "example_value": "2026-11-01",
+            },
+            "days": {
+                "description": "nombre de jours de la période commençant à date_from",
+                "type": "int",
+                "example_value": 7,
+            },
         },
     )
-    def generate_hour_availability(self, request, room, start=0, end=365):
+    def generate_hour_availability(self, request, room, start=0, end=365, format="slots", date_from=None, days=7):
+        if format not in availability.AVAILABILITY_FORMATS:
+            raise APIError(f"format must be one of {', '.join(availability.AVAILABILITY_FORMATS)}")
+
         rooms = self.get_rooms_for_indisponibilities(request, room)
 
-        indisponibilites = self.get_indisponibilities(request, rooms, start)
-
-        start_datetime = datetime.datetime.combine(datetime.date.today(), datetime.datetime.min.time()) + datetime.timedelta(days=start)
-        end_datetime = datetime.datetime.combine(datetime.date.today(), datetime.time(23, 0)) + datetime.timedelta(days=end)
-        delta = int((end_datetime - start_datetime).total_seconds() / 3600)
-        hours = [start_datetime + datetime.timedelta(hours=x) for x in range(delta + 1)]
-        free_hours = []
-        for hour in hours:
-            disabled = False
-            for x in indisponibilites:
-                start_indispo = string_to_datetime(x["StartDate"])
-                end_indispo = string_to_datetime(x["EndDate"])
-
-                # L'heure est bloquée si elle tombe pile dedans ou sur les bornes
-                if start_indispo <= hour <= end_indispo:
-                    disabled = True
-                    break  # Pas besoin de vérifier les autres indisponibilités pour cette heure
-
-            # Le reste de ton dictionnaire reste identique
-            free_hours.append({
-                "text": hour.strftime("%d/%m/%Y %H:%M"),
-                "id": hour.strftime("%Y-%m-%dT%H:%M"),
-                "start_date": hour.strftime("%Y-%m-%d"),
-                "end_date": hour.strftime("%Y-%m-%d"),
-                "start_time": hour.strftime("%H:%M"),
-                "end_time": hour.strftime("%H:59"),
-                "disabled": disabled
-            })
-        return {"data": free_hours}
+        if date_from:
+            start_date, end_date = self.parse_availability_window(date_from, days)
+            start_datetime = datetime.datetime.combine(start_date, datetime.datetime.min.time())
+            end_datetime = datetime.datetime.combine(end_date, datetime.time(23, 0))
+        else:
+            start_datetime = datetime.datetime.combine(datetime.date.today(), datetime.datetime.min.time()) + datetime.timedelta(days=start)
+            end_datetime = datetime.datetime.combine(datetime.date.today(), datetime.time(23, 0)) + datetime.timedelta(days=end)
+        hours = availability.hours_between(start_datetime, end_datetime)
+
+        if date_from:
+            indisponibilites = self.get_window_indisponibilities(request, rooms, start_date, end_date)
+            flags = availability.hour_flags(indisponibilites, hours)
+        elif 0 <= start <= end < availability.OCCUPANCY_DAYS:
+            flags = self.get_occupancy(request, rooms).hour_flags(start_datetime, len(hours))
+        else:
+            # période non couverte par les tableaux d'occupation
+            indisponibilites = self.get_indisponibilities(request, rooms, start)
+            flags = availability.hour_flags(indisponibilites, hours)
+
+        return self.availability_response(hours, flags, availability.hour_slot, format, end_datetime.date())
+
+    @endpoint(
+        name="generate-availability-matrix",
+        perm="can_access",
+        description="Générer la grille de disponibilité de plusieurs salles",
+        long_description=(
+            "Générer la grille de disponibilité de plusieurs salles dans ATAL, à partir d'une "
+            "seule lecture des locations et du patrimoine louable."
+        ),
+        display_category="Location de Salles",
+        display_order=17,
+        methods=["get"],
+        parameters={
+            "rooms": {
+                "description": "ids des salles séparés par des virgules, toutes les salles louables si vide",
+                "type": "string",
+                "example_value": "2732,2733",
+            },
+            "start": {
+                "description": "premier jour de la grille, en jours à partir d'aujourd'hui",
+                "type": "int",
+                "example_value": 0,
+            },
+            "end": {
+                "description": "dernier jour de la grille, en jours à partir d'aujourd'hui",
+                "type": "int",
+                "example_value": 6,
+            },
+            "granularity": {
+                "description": "hour ou day",
+                "type": "string",
+                "example_value": "hour",
+            },
+        },
+    )
+    def generate_availability_matrix(self, request, rooms=None, start=0, end=6, granularity="hour"):
+        if granularity not in ("hour", "day"):
+            raise APIError("granularity must be hour or day")
+
+        try:
+            start, end = int(start), int(end)
+        except (TypeError, ValueError):
+            raise APIError("start and end must be integers")
+        if start < 0:
+            raise APIError("start must be positive")
+        if end < start:
+            raise APIError("end must be greater than or equal to start")
+        max_days = self.matrix_max_days[granularity]
+        if end - start >= max_days:
+            raise APIError(f"the grid cannot span more than {max_days} days with granularity {granularity}")
+
+        hierarchy = RoomHierarchy([room.data for room in self.get_rooms()])
+        all_rooms = not rooms or rooms == "all"
+        if not all_rooms:
+            try:
+                room_ids = [int(room) for room in rooms.split(",") if room.strip()]
+            except ValueError:
+                raise APIError("rooms must be a comma-separated list of room ids")
+        else:
+            room_ids = [room["Id"] for room in hierarchy.rooms]
+        if not room_ids:
+            return {"data": [], "slots": []}
+        closures = {room: self.get_rooms_for_indisponibilities(request, room, hierarchy) for room in room_ids}
+
+        today = datetime.date.today()
+        first_day = today + datetime.timedelta(days=start)
+        last_day = today + datetime.timedelta(days=end)
+
+        # une seule lecture des locations, limitée aux jours de la grille et aux salles
+        # concernées ; pour toutes les salles, le filtre RoomId dépasserait la longueur d'URL
+        # admise par le serveur d'ATAL : les locations sont alors triées par salle ci-dessous
+        intervals = {}
+        window_rooms = None if all_rooms else sorted({x for closure in closures.values() for x in closure})
+        for interval in self.get_window_indisponibilities(request, window_rooms, first_day, last_day):
+            intervals.setdefault(interval.room_id, []).append(interval)
+
+        if granularity == "day":
+            points = availability.days_between(first_day, last_day)
+            slots = [availability.day_slot(day, False) for day in points]
+        else:
+            points = availability.hours_between(
+                datetime.datetime.combine(first_day, datetime.time()),
+                datetime.datetime.combine(last_day, datetime.time(23)),
+            )
+            slots = [availability.hour_slot(hour, False) for hour in points]
+
+        flags = availability.day_flags if granularity == "day" else availability.hour_flags
+        data = []
+        for room in room_ids:
+            room_intervals = [interval for x in closures[room] for interval in intervals.get(x, [])]
+            data.append({"id": room, "disabled": flags(room_intervals, points)})
+
+        return {"data": data, "slots": [{"id": slot["id"], "text": slot["text"]} for slot in slots]}
 
     @endpoint(
         name="bookings-room",
@@ -841,21 +1039,30 @@ class imio_atal(BaseResource):
                 "type": "int",
                 "example_value": 63,
             },
+            "single_loan": {
+                "description": (
+                    "Si True, une seule réservation avec une ligne par plage horaire ; "
+                    "sinon une réservation par plage horaire, envoyées en parallèle"
+                ),
+                "type": "boolean",
+                "example_value": False,
+            },
         }
     )
-    def bookings_room(self, request, room, nombre_personne_prevue=0, nombre_personne_reel=0, id_tier=63):
+    def bookings_room(
+        self, request, room, nombre_personne_prevue=0, nombre_personne_reel=0, id_tier=63, single_loan=False
+    ):
         post_data = json.loads(request.body)
         booking_dates = post_data.get("booking_dates", [])
-        delta = datetime.timedelta(minutes=1)
         merged_intervals = []
         current_interval = booking_dates[0]
 
         for i in range(1, len(booking_dates)):
-            current_end = string_to_datetime(f'{current_interval["end_date"]}T{current_interval["end_time"]}')
-            next_start = string_to_datetime(f'{booking_dates[i]["start_date"]}T{booking_dates[i]["start_time"]}')
+            current_end = string_to_epoch_minutes(f'{current_interval["end_date"]}T{current_interval["end_time"]}')
+            next_start = string_to_epoch_minutes(f'{booking_dates[i]["start_date"]}T{booking_dates[i]["start_time"]}')
 
             # Vérifier s'il n'y a qu'une minute d'écart
-            if next_start == current_end + delta:
+            if next_start == current_end + 1:
                 current_interval["end_date"] = booking_dates[i]["end_date"]
                 current_interval["end_time"] = booking_dates[i]["end_time"]
             else:
@@ -865,16 +1072,196 @@ class imio_atal(BaseResource):
         # Ajouter le dernier intervalle
         merged_intervals.append(current_interval)
 
+        dates = [
+            (f'{interval["start_date"]}T{interval["start_time"]}', f'{interval["end_date"]}T{interval["end_time"]}')
+            for interval in merged_intervals
+        ]
+        # une seule location avec une ligne par plage horaire, ou une location par plage
+        loans = [dates] if single_loan else [[interval_dates] for interval_dates in dates]
+
+        rooms = self.get_rooms_for_indisponibilities(request, room)
+        with self.hold_rooms(rooms):
+            self.check_room_conflicts(request, rooms, dates)
+            results = self.fan_out(
+                [
+                    functools.partial(
+                        self.post_room_loan, loan_dates, room, nombre_personne_prevue, nombre_personne_reel, id_tier
+                    )
+                    for loan_dates in loans
+                ]
+            )
+            self.room_loans_changed([room])
+
         responses = {"data": []}
+        errors = []
+        for loan_dates, (response, error) in zip(loans, results):
+            if error is None:
+                responses["data"].append(response)
+                continue
+            self.logger.warning(f"ATAL Error: room {room} booking {loan_dates}: {error}")
+            errors.extend(
+                {"start_date": start[:10], "start_time": start[11:], "end_date": end[:10], "end_time": end[11:],
+                 "err_desc": str(error)}
+                for start, end in loan_dates
+            )
 
-        for interval in merged_intervals:
-            response = self.write_reservation_room(request, interval["start_date"], interval["end_date"], interval["start_time"],
-                                        interval["end_time"], room, nombre_personne_prevue, nombre_personne_reel,
-                                        id_tier)
-            responses["data"].append(response)
+        if errors:
+            raise APIError(
+                f"ATAL Error: {len(errors)} plage(s) horaire(s) non réservée(s)",
+                data={"bookings": responses["data"], "errors": errors},
+            )
 
         return responses
 
+    def post_room_loan(self, dates, room, nombre_personne_prevue=0, nombre_personne_reel=0, id_tier=63):
+        """
+        inscrit une location de salle dans ATAL
+        :param dates: liste de (début, fin) au format 2000-12-31T23:59, une ligne de location par plage
+        :return: réponse d'ATAL
+        """
+        payload = json.dumps(
+            {
+                "EndDate": max(end for start, end in dates),
+                "PlannedPeopleNumber": nombre_personne_prevue,
+                "RealPeopleNumber": nombre_personne_reel,
+                "RequesterThirdPartyId": id_tier,
+                "Rooms": [
+                    {
+                        "EndDate": end,
+                        "Pricing": {
+                            "AdditionalQuantity": 0,
+                            "AppliedPricingId": 0,
+                            "BaseQuantity": 0,
+                            "SquareMetersNumber": 0,
+                        },
+                        "RoomId": room,
+                        "StartDate": start,
+                    }
+                    for start, end in dates
+                ],
+                "StartDate": min(start for start, end in dates),
+            }
+        )
+
+        return self.atal.post("/api/RoomLoans", data=payload, headers={"Content-Type": "application/json"})
+
+    @contextlib.contextmanager
+    def hold_rooms(self, rooms):
+        """
+        bloque localement les salles le temps d'inscrire une location : deux workers ne
+        peuvent pas réserver en même temps la même salle, son parent ou ses enfants
+        :param rooms: salle réservée, son parent et ses enfants (get_rooms_for_indisponibilities)
+        """
+        now = timezone.now()
+        expires = now + datetime.timedelta(seconds=self.room_hold_timeout)
+        rooms = sorted({int(room) for room in rooms})
+        # blocages laissés par un worker interrompu
+        self.room_holds.filter(expires__lt=now).delete()
+        try:
+            with transaction.atomic():
+                AtalRoomHold.objects.bulk_create(
+                    [AtalRoomHold(resource=self, room_id=room, expires=expires) for room in rooms]
+                )
+        except IntegrityError:
+            raise APIError("Une réservation de cette salle est déjà en cours, veuillez réessayer.")
+        try:
+            yield
+        finally:
+            self.room_holds.filter(room_id__in=rooms, expires=expires).delete()
+
+    def check_room_conflicts(self, request, rooms, dates):
+        """
+        vérifie, avant d'écrire dans ATAL, qu'aucune location connue ne chevauche les plages
+        demandées dans les salles données ; mêmes règles que les sources de disponibilité,
+        bornes comprises
+        :param dates: liste de (début, fin) au format 2000-12-31T23:59
+        """
+        bounds = [(string_to_epoch_minutes(start), string_to_epoch_minutes(end)) for start, end in dates]
+        first_day = datetime.date.fromisoformat(min(start for start, end in dates)[:10])
+        last_day = datetime.date.fromisoformat(max(end for start, end in dates)[:10])
+        # lecture dans ATAL, jamais dans la copie locale : une location déplacée depuis la
+        # dernière relecture du miroir serait réservée en double
+        for interval in self.get_window_indisponibilities(request, rooms, first_day, last_day, live=True):
+            for (start, end), (start_date, end_date) in zip(bounds, dates):
+                if interval.start <= end and start <= interval.end:
+                    raise APIError(
+                        f"La salle n'est plus disponible du {start_date} au {end_date}.",
+                        data={"start": start_date, "end": end_date, "room": interval.room_id},
+                    )
+
+    def room_loans_changed(self, rooms):
+        """
+        les nouvelles locations doivent apparaître tout de suite dans les disponibilités ;
+        appelé après l'écriture dans ATAL, cela ne doit jamais faire échouer l'endpoint : la
+        location existe, un nouvel essai du client créerait un doublon
+        """
+        if self.loans_mirror_max_age:
+            try:
+                self.sync_room_loan_lines()
+            except Exception as e:
+                # la synchronisation toutes les 5 minutes rattrapera le miroir
+                self.logger.warning(f"room loans mirror sync failed after booking: {e}")
+        try:
+            self.invalidate_occupancy(rooms)
+        except Exception as e:
+            self.logger.warning(f"occupancy invalidation failed after booking: {e}")
+
+    @property
+    def call_slots(self):
+        """places d'appel simultané vers ATAL du connecteur, une seule réserve par processus"""
+        key = (self.pk, self.max_concurrent_calls or 1)
+        with _call_slots_lock:
+            slots = _call_slots.get(key)
+            if slots is None:
+                # max_concurrent_calls modifié : les appels en cours gardent l'ancienne réserve
+                for old_key in [old_key for old_key in _call_slots if old_key[0] == self.pk]:
+                    del _call_slots[old_key]
+                slots = _call_slots[key] = threading.BoundedSemaphore(key[1])
+        return slots
+
+    def fan_out(self, calls, max_workers=None):
+        """
+        exécute des appels indépendants dans un pool de threads borné : la durée totale est
+        celle de l'appel le plus lent plutôt que la somme de tous les appels ; les appels
+        simultanés de tous les endpoints du connecteur sont limités à max_concurrent_calls
+        :param calls: liste de fonctions sans argument
+        :param max_workers: nombre maximum de threads, max_concurrent_calls par défaut
+        :return: liste de (résultat, exception), dans l'ordre des appels
+        """
+        if not max_workers:
+            max_workers = self.max_concurrent_calls or 1
+
+        def run(call):
+            try:
+                return call(), None
+            except Exception as e:
+                return None, e
+
+        # les threads partagent les GET mémorisés et le décompte de l'appel d'endpoint en cours
+        invocation = current_invocation()
+
+        slots = self.call_slots
+
+        def run_in_thread(call):
+            try:
+                with slots, invocation_scope(invocation):
+                    _fan_out_local.active = True
+                    try:
+                        return run(call)
+                    finally:
+                        _fan_out_local.active = False
+            finally:
+                # chaque thread a ses propres connexions à la base (journalisation des appels)
+                connections.close_all()
+
+        # un appel lancé depuis un thread de fan_out occupe déjà une place : attendre une
+        # autre place pourrait bloquer tous les threads
+        if len(calls) <= 1 or getattr(_fan_out_local, "active", False):
+            return [run(call) for call in calls]
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(calls))) as executor:
+            return list(executor.map(run_in_thread, calls))
+
     @endpoint(
         name="post-reservation-room",
         perm="can_access",
@@ -938,50 +1325,18 @@ class imio_atal(BaseResource):
             nombre_personne_reel=0,
             id_tier=63,
     ):
-        url = f"{self.base_url}/api/RoomLoans"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-            "Content-Type": "application/json",
-        }
-
         datetime_debut = f"{date_debut}T{heure_debut}"
         datetime_fin = f"{date_fin}T{heure_fin}"
         # room = ast.literal_eval(room)
 
-        payload = json.dumps(
-            {
-                "EndDate": datetime_fin,
-                "PlannedPeopleNumber": nombre_personne_prevue,
-                "RealPeopleNumber": nombre_personne_reel,
-                "RequesterThirdPartyId": id_tier,
-                "Rooms": [
-                    {
-                        "EndDate": datetime_fin,
-                        "Pricing": {
-                            "AdditionalQuantity": 0,
-                            "AppliedPricingId": 0,
-                            "BaseQuantity": 0,
-                            "SquareMetersNumber": 0,
-                        },
-                        "RoomId": room,
-                        "StartDate": datetime_debut,
-                    }
-                ],
-                "StartDate": datetime_debut,
-            }
-        )
-
-        response = self.requests.post(
-            url,
-            headers=headers,
-            data=payload,
-            verify=False,
-        )
-
-        response.raise_for_status()
+        dates = [(datetime_debut, datetime_fin)]
+        rooms = self.get_rooms_for_indisponibilities(request, room)
+        with self.hold_rooms(rooms):
+            self.check_room_conflicts(request, rooms, dates)
+            response = self.post_room_loan(dates, room, nombre_personne_prevue, nombre_personne_reel, id_tier)
+            self.room_loans_changed([room])
 
-        return response.json()
+        return response
 
     @endpoint(
         name="patch-booking-room",
@@ -1010,43 +1365,44 @@ class imio_atal(BaseResource):
             room_loan_id,
             request_state,
     ):
-        url = f"{self.base_url}/api/RoomLoans?id={room_loan_id}"
-        headers = {
-            "accept": "*/*",
-            "X-API-Key": self.api_key,
-            "Content-Type": "application/json",
-        }
         payload = json.dumps({"RequestState": int(request_state)})
 
         try:
-            response = self.requests.patch(
-                url,
-                headers=headers,
+            response = self.atal.request(
+                "PATCH",
+                "/api/RoomLoans",
+                params={"id": room_loan_id},
+                accept="*/*",
+                headers={"Content-Type": "application/json"},
                 data=payload,
-                verify=False,
+                raise_for_status=False,
             )
-        except RequestException as e:
-            self.logger.warning(f'ATAL Error: {e}')
-            raise APIError(f'ATAL Error: {e}')
+        finally:
+            # la réservation n'indique pas ses salles : toutes les occupations sont recalculées
+            self.invalidate_occupancy()
 
         if response.headers.get('Content-Type') == 'application/json':
-            json_response = None
-            try:
-                json_response = response.json()
-            except ValueError:
-                self.logger.warning('ATAL Error: bad JSON response')
-                raise APIError('ATAL Error: bad JSON response')
-
-            return json_response
+            return self.atal.decode(response)
 
-        try:
-            response.raise_for_status()
-        except RequestException as e:
-            self.logger.warning(f'ATAL Error: {e}')
-            raise APIError(f'ATAL Error: {e}')
+        self.atal.raise_for_status(response)
         self.logger.info(f'ATAL PATCH Booking Room {room_loan_id} successful')
         return
 
+    @endpoint(
+        name="refresh-rooms",
+        perm="can_access",
+        description="Rafraîchit l'arborescence des salles.",
+        long_description=(
+            "Relit immédiatement le patrimoine louable dans ATAL. Il est sinon "
+            "rafraîchi toutes les heures."
+        ),
+        display_category="Location de Salles",
+        display_order=16,
+        methods=["post"],
+    )
+    def refresh_rooms(self, request):
+        return {"data": {"count": self.sync_rooms()}}
+
     #############################
     ### Location de matériels ###
     #############################
@@ -1059,28 +1415,40 @@ class imio_atal(BaseResource):
         display_category="Location de Matériels",
         display_order=1,
         methods=["get"],
+        parameters={
+            "select": {
+                "description": (
+                    "Champs renvoyés par ATAL ($select), séparés par des virgules. "
+                    "Par défaut, tous les champs."
+                ),
+                "type": "string",
+                "example_value": "Id,ItemId,Item",
+            },
+            "limit": {
+                "description": "Nombre maximum d'éléments renvoyés",
+                "type": "int",
+                "example_value": 100,
+            },
+        },
     )
-    def get_loanable_items(self, request):
-        url = f"{self.base_url}/api/InventoriedItems"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-        response = self.requests.get(
-            url,
-            headers=headers,
-            verify=False,
-        )
-
-        response.raise_for_status()
-
-        response = [x for x in response if x["Item"]["ItemTemplate"]["CanBeLoaned"]]
-
-        # Suppression des doublons
+    def get_loanable_items(self, request, select=None, limit=None):
+        params = {"$filter": "Item/ItemTemplate/CanBeLoaned"}
+        if select:
+            # ItemId sert à supprimer les doublons : sans lui, tout serait dédoublonné en un élément
+            if "ItemId" not in select.split(","):
+                select = f"{select},ItemId"
+            params["$select"] = select
+        limit = self.parse_limit(limit)
+
+        # Suppression des doublons, page par page
         loanable_items = []
-        for i in response:
-            if i["ItemId"] not in [x["ItemId"] for x in loanable_items]:
+        item_ids = set()
+        for i in self.atal.iter_items("/api/InventoriedItems", params=params):
+            if i.get("ItemId") not in item_ids:
+                item_ids.add(i.get("ItemId"))
                 loanable_items.append(i)
+                if limit is not None and len(loanable_items) >= limit:
+                    break
 
         return {"datas": loanable_items}
 
@@ -1092,30 +1460,26 @@ class imio_atal(BaseResource):
         display_category="Location de Matériels",
         display_order=2,
         methods=["get"],
+        parameters={
+            "select": {
+                "description": (
+                    "Champs renvoyés par ATAL ($select), séparés par des virgules. "
+                    "Par défaut, tous les champs."
+                ),
+                "type": "string",
+                "example_value": "Id,Name",
+            },
+        },
     )
-    def read_materiel_list(self, request):
-        url = f"{self.base_url}/api/Patrimonies"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-
-        # pour avoir le patrimoine louable
-        params = {
-            "$filter": "CanBeLoaned",
-        }
-        response = self.requests.get(
-            url,
-            headers=headers,
-            params=params,
-            verify=False,
-        )
-
-        response.raise_for_status()
+    def read_materiel_list(self, request, select=None):
+        # patrimoine louable sauf les salles, filtré par ATAL
+        if select and "Type" not in select.split(","):
+            select = f"{select},Type"
+        response = self.read_patrimoines_louable(request, filters="and Type ne 1", select=select)
 
         # retourne tout le patrimoine louable sauf les salles
         return {
-            "data": [x for x in response.json() if "Type" in x and x["Type"] != 1]
+            "data": [x for x in response if "Type" in x and x["Type"] != 1]
         }  # must return dict
 
     @endpoint(
@@ -1126,22 +1490,16 @@ class imio_atal(BaseResource):
         display_category="Location de Matériels",
         display_order=3,
         methods=["get"],
+        parameters={
+            "limit": {
+                "description": "Nombre maximum d'éléments renvoyés",
+                "type": "int",
+                "example_value": 100,
+            },
+        },
     )
-    def read_reservations_materiel(self, request):
-        url = f"{self.base_url}/api/MaterialLoans"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-        response = self.requests.get(
-            url,
-            headers=headers,
-            verify=False,
-        )
-
-        response.raise_for_status()
-
-        return response.json()  # must return dict
+    def read_reservations_materiel(self, request, limit=None):
+        return self.read_collection("/api/MaterialLoans", limit=limit)  # must return dict
 
     @endpoint(
         name="get-reservation-materiel",
@@ -1160,20 +1518,7 @@ class imio_atal(BaseResource):
         },
     )
     def read_reservation_materiel(self, request, id):
-        url = f"{self.base_url}/api/MaterialLoans/{id}"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-        response = self.requests.get(
-            url,
-            headers=headers,
-            verify=False,
-        )
-
-        response.raise_for_status()
-
-        return response.json()  # must return dict
+        return self.atal.get(f"/api/MaterialLoans/{id}")  # must return dict
 
     @endpoint(
         name="get-materiel-loans-details",
@@ -1183,22 +1528,16 @@ class imio_atal(BaseResource):
         display_category="Location de Matériels",
         display_order=5,
         methods=["get"],
+        parameters={
+            "limit": {
+                "description": "Nombre maximum d'éléments renvoyés",
+                "type": "int",
+                "example_value": 100,
+            },
+        },
     )
-    def read_materiel_loans_details(self, request):
-        url = f"{self.base_url}/api/MaterialLoans/Lines"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-        response = self.requests.get(
-            url,
-            headers=headers,
-            verify=False,
-        )
-
-        response.raise_for_status()
-
-        return response.json()  # must return dict
+    def read_materiel_loans_details(self, request, limit=None):
+        return self.read_collection("/api/MaterialLoans/Lines", limit=limit)  # must return dict
 
     @endpoint(
         name="post-reservation-materiel",
@@ -1257,13 +1596,6 @@ class imio_atal(BaseResource):
             quantity,
             id_tier,
     ):
-        url = f"{self.base_url}/api/MaterialLoans"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-            "Content-Type": "application/json",
-        }
-
         datetime_debut = f"{date_debut}T{heure_debut}Z"
         datetime_fin = f"{date_fin}T{heure_fin}Z"
 
@@ -1283,16 +1615,7 @@ class imio_atal(BaseResource):
             }
         )
 
-        response = self.requests.post(
-            url,
-            headers=headers,
-            data=payload,
-            verify=False,
-        )
-
-        response.raise_for_status()
-
-        return response.json()
+        return self.atal.post("/api/MaterialLoans", data=payload, headers={"Content-Type": "application/json"})
 
     @endpoint(
         name="get-natures",
@@ -1322,32 +1645,7 @@ class imio_atal(BaseResource):
     def get_atal_thematics(
             self, request=None, primary_only=False, secondary_only=False, parent_id=None
     ):
-        url = f"{self.base_url}/api/Thematics"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-
-        try:
-            response = self.requests.get(
-                url,
-                headers=headers,
-            )
-        except (requests.Timeout, requests.RequestException) as exc:
-            raise APIError(str(exc))
-        try:
-            response.raise_for_status()
-        except requests.RequestException as main_exc:
-            try:
-                err_data = response.json()
-            except (json.JSONDecodeError, requests.exceptions.RequestException):
-                err_data = {"response_text": response.text}
-            raise APIError(str(main_exc), data=err_data)
-
-        try:
-            json_response = response.json()
-        except (json.JSONDecodeError, requests.exceptions.RequestException) as exc:
-            raise APIError(str(exc))
+        json_response = self.get_reference_data("/api/Thematics", self.thematics_cache_ttl)
 
         parsed_thematics = [
             {
@@ -1404,31 +1702,12 @@ class imio_atal(BaseResource):
     )
     def get_attachments_files(self, request, attachments_id):
 
-        url_attachments = f"{self.base_url}/api/Attachments/{attachments_id}"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-
-        response_attachments = self.requests.get(
-            url_attachments,
-            headers=headers,
-            verify=False,
-        )
-        response_attachments.raise_for_status()
-
-        response_attachments_json = response_attachments.json()
+        response_attachments_json = self.atal.get(f"/api/Attachments/{attachments_id}")
         key = response_attachments_json.get("Key")
         if not key:
             raise APIError("Key not found in response")
 
-        url_download = f"{self.base_url}/api/Attachments/Download/{key}"
-        response_download = self.requests.get(
-            url_download,
-            headers=headers,
-            verify=False,
-        )
-        response_download.raise_for_status()
+        response_download = self.atal.request("GET", f"/api/Attachments/Download/{key}")
 
         filename = response_attachments_json.get("FileName")
 
@@ -1475,31 +1754,12 @@ class imio_atal(BaseResource):
     )
     def get_attachments(self, request, attachments_id):
 
-        url_attachments = f"{self.base_url}/api/Attachments/{attachments_id}"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-
-        response_attachments = self.requests.get(
-            url_attachments,
-            headers=headers,
-            verify=False,
-        )
-        response_attachments.raise_for_status()
-
-        response_attachments_json = response_attachments.json()
+        response_attachments_json = self.atal.get(f"/api/Attachments/{attachments_id}")
         key = response_attachments_json.get("Key")
         if not key:
             raise APIError("Key not found in response")
 
-        url_download = f"{self.base_url}/api/Attachments/Download/{key}"
-        response_download = self.requests.get(
-            url_download,
-            headers=headers,
-            verify=False,
-        )
-        response_download.raise_for_status()
+        response_download = self.atal.request("GET", f"/api/Attachments/Download/{key}")
 
         response = {
             "content": base64.b64encode(response_download.content).decode("utf-8"),
@@ -1542,24 +1802,38 @@ class imio_atal(BaseResource):
 
         features_value = room_info.get("FeaturesValues", [])
 
-        response = []
         combos = self.get_service("combo")
         combo = [combo for combo in combos if not combo.get("is-portal-agent")][0]
 
-        for feature in features_value:
-            if feature.get("AttachmentId") and feature.get("AttachmentId") not in exclude:
-                try:
-                    attachment = self.get_attachments(request, feature.get("AttachmentId"))
-                except Exception as e:
-                    self.logger.warning(f"Error while getting attachment {feature.get('AttachmentId')}: {e}")
-                    continue
-                signed_url = sign_url(
-                    url=f"{combo['url']}api/assets/set/salle:{feature.get('AttachmentId')}/?orig={combo.get('orig')}",
-                    key=combo.get("secret"),
-                )
-                combo_response = self.requests.post(signed_url, json={"asset": attachment})
-                combo_response.raise_for_status()
-                response.append(combo_response.json())
+        def publish_attachment(attachment_id):
+            try:
+                attachment = self.get_attachments(request, attachment_id)
+            except Exception as e:
+                self.logger.warning(f"Error while getting attachment {attachment_id}: {e}")
+                return None
+            signed_url = sign_url(
+                url=f"{combo['url']}api/assets/set/salle:{attachment_id}/?orig={combo.get('orig')}",
+                key=combo.get("secret"),
+            )
+            combo_response = self.requests.post(signed_url, json={"asset": attachment})
+            combo_response.raise_for_status()
+            return combo_response.json()
+
+        # chaque pièce jointe (lecture et téléchargement dans ATAL, envoi à combo) est
+        # indépendante des autres
+        attachment_ids = [
+            feature.get("AttachmentId")
+            for feature in features_value
+            if feature.get("AttachmentId") and feature.get("AttachmentId") not in exclude
+        ]
+        results = self.fan_out([functools.partial(publish_attachment, x) for x in attachment_ids])
+
+        response = []
+        for result, error in results:
+            if error is not None:
+                raise error
+            if result is not None:
+                response.append(result)
 
         return response
 
@@ -1589,12 +1863,6 @@ class imio_atal(BaseResource):
         },
     )
     def get_features(self, request, expands=None, filters=None):
-        url = f"{self.base_url}/api/Features"
-        headers = {
-            "accept": "application/json",
-            "X-API-Key": self.api_key,
-        }
-
         params = {}
         if expands:
             params["$expand"] = expands
@@ -1604,15 +1872,7 @@ class imio_atal(BaseResource):
         if not params:
             params["$top"] = 100
 
-        response = self.requests.get(
-            url,
-            headers=headers,
-            params=params,
-            verify=False,
-        )
-        response.raise_for_status()
-
-        return {"data": response.json()}
+        return {"data": self.get_reference_data("/api/Features", self.features_cache_ttl, params=params)}
 
 ################
 # Utilitaires #
@@ -1624,26 +1884,394 @@ class imio_atal(BaseResource):
         services = list(settings.KNOWN_SERVICES[service_id].values())
         return services
 
-    def get_rooms_for_indisponibilities(self, request, room):
-        rooms = [room,]
-        # Get infos salle pour récupérer le parent s'il existe
-        infos_salle = self.read_room(request, room)
-        parent_id = infos_salle.get("ParentId")
+    def get_rooms_for_indisponibilities(self, request, room, hierarchy=None):
+        if hierarchy is not None:
+            # Le parent d'une salle louable est connu sans appel supplémentaire,
+            # sinon on récupère les infos de la salle
+            if room in hierarchy:
+                parent_id = hierarchy.parent_of(room)
+            else:
+                parent_id = self.read_room(request, room).get("ParentId")
+            return hierarchy.rooms_for_indisponibilities(room, parent_id)
+
+        rooms = self.get_rooms()
+        stored_room = rooms.filter(atal_id=room).first()
+        if stored_room:
+            parent_id = stored_room.parent_id
+        else:
+            parent_id = self.read_room(request, room).get("ParentId")
+
+        result = [room]
         # Vérification si le parent est louable
-        if parent_id:
-            parent_room = self.read_patrimoines_louable(request, f"and Id eq {parent_id}")
-            if parent_room:
-                rooms.append(parent_id)
+        if parent_id and rooms.filter(atal_id=parent_id).exists():
+            result.append(parent_id)
         # Vérification s'il y a des enfants louable
-        kids_rooms = self.read_kids_rooms(request, room)["data"]
-        if kids_rooms:
-            rooms.extend([x["Id"] for x in kids_rooms])
+        result.extend(rooms.filter(type=1, parent_id=room).values_list("atal_id", flat=True))
+
+        return result
+
+    def get_rooms(self):
+        """patrimoine louable enregistré, synchronisé avec ATAL au premier appel"""
+        if not self.rooms.exists():
+            self.sync_rooms(if_empty=True)
+        return self.rooms.all()
+
+    def sync_rooms(self, if_empty=False):
+        """
+        remplace le patrimoine louable enregistré par celui d'ATAL
+        :param if_empty: ne synchronise que si aucune salle n'est enregistrée (premier appel)
+        :return: nombre de salles enregistrées
+        """
+        with transaction.atomic():
+            # une seule synchronisation à la fois par connecteur (requêtes simultanées au
+            # premier appel, tâche horaire, refresh-rooms) : sinon deux transactions
+            # insèrent les mêmes salles
+            imio_atal.objects.select_for_update().filter(pk=self.pk).first()
+            if if_empty and self.rooms.exists():
+                # synchronisé par une autre requête pendant l'attente du verrou
+                return self.rooms.count()
+            # lecture directe, sans le cache des données de référence : refresh-rooms et la
+            # synchronisation horaire doivent voir les salles ajoutées dans ATAL
+            patrimonies = self.atal.get("/api/Patrimonies", params={"$filter": "CanBeLoaned"})
+            self.rooms.all().delete()
+            AtalRoom.objects.bulk_create(
+                [
+                    AtalRoom(
+                        resource=self,
+                        atal_id=patrimony["Id"],
+                        parent_id=patrimony.get("ParentId"),
+                        type=patrimony.get("Type"),
+                        position=position,
+                        data=patrimony,
+                    )
+                    for position, patrimony in enumerate(patrimonies)
+                ]
+            )
+        return len(patrimonies)
+
+    def every5min(self):
+        super().every5min()
+        if self.loans_mirror_max_age:
+            # relecture complète : une location déplacée ou annulée dans ATAL garde son Id,
+            # seule une relecture complète libère ou bloque les bons créneaux
+            self.sync_room_loan_lines(full=True)
+
+    def hourly(self):
+        super().hourly()
+        self.sync_rooms()
+        self.warm_reference_data()
+
+    def get_reference_data(self, path, cache_ttl, params=None, **kwargs):
+        """
+        lecture des données de référence ATAL (patrimoine, thématiques, tiers, features),
+        gardées en cache puis servies périmées le temps d'être rafraîchies
+        :param cache_ttl: durée de cache en minutes, 0 pour toujours interroger ATAL
+        """
+        return self.atal.get(
+            path,
+            params=params,
+            cache_timeout=cache_ttl * 60,
+            stale_timeout=self.reference_stale_max_age * 60,
+            **kwargs,
+        )
 
-        return rooms
+    def warm_reference_data(self):
+        """
+        garde en cache les données des sources get-natures et get-rooms-name, pour qu'elles
+        n'attendent jamais ATAL
+        """
+        for warm in (self.get_atal_thematics, self.read_rooms_name):
+            try:
+                warm(None)
+            except APIError as e:
+                self.logger.warning(f"ATAL Error: {e}")
 
     def get_indisponibilities(self, request, rooms, start):
-        query = ""
-        for room in rooms:
-            query += f" or RoomId eq {room}" if query else f"RoomId eq {room}"
-        indisponibilites = self.read_dates_dispo(request, start, filters=query)["data"]
-        return indisponibilites
+        """
+        locations des salles données commençant au plus tôt `start` jours après aujourd'hui
+        :param rooms: liste d'ids de salles
+        :return: liste de LoanInterval
+        """
+        start_date = datetime.datetime.combine(datetime.date.today(), datetime.datetime.min.time())
+        start_date += datetime.timedelta(days=start)
+        rooms_query = " or ".join(f"RoomId eq {room}" for room in rooms)
+        # parenthèses : le filtre sur la date doit s'appliquer à toutes les salles
+        query = f"({rooms_query}) and StartDate ge {start_date.strftime('%Y-%m-%d')}"
+
+        indisponibilites = self.get_room_loan_lines(
+            request, query, room_id__in=rooms, start_date__gte=start_date.replace(tzinfo=ATAL_TIMEZONE)
+        )
+        return availability.loan_intervals(indisponibilites)
+
+    def parse_limit(self, limit):
+        if limit is None or limit == "":
+            return None
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise APIError("limit must be an integer")
+        if limit < 0:
+            raise APIError("limit must be positive")
+        return limit
+
+    def read_collection(self, path, params=None, limit=None):
+        """
+        lit une collection ATAL page par page, en s'arrêtant à `limit` éléments
+        """
+        return list(itertools.islice(self.atal.iter_items(path, params=params), self.parse_limit(limit)))
+
+    def parse_availability_window(self, date_from, days):
+        """
+        :return: premier et dernier jour de la période de `days` jours commençant à date_from
+        """
+        try:
+            start_date = datetime.date.fromisoformat(date_from)
+            days = int(days)
+        except (TypeError, ValueError):
+            raise APIError("date_from must be a date (YYYY-MM-DD) and days an integer")
+        if days < 1:
+            raise APIError("days must be at least 1")
+        return start_date, start_date + datetime.timedelta(days=days - 1)
+
+    def get_window_indisponibilities(self, request, rooms, start_date, end_date, live=False):
+        """
+        locations des salles données qui chevauchent les jours start_date à end_date inclus,
+        le filtre sur les dates étant appliqué par ATAL ou par la copie locale
+        :param rooms: liste d'ids de salles, None pour toutes les salles
+        :param live: lit toujours ATAL, même si la copie locale est assez récente
+        :return: liste de LoanInterval
+        """
+        window_start = datetime.datetime.combine(start_date, datetime.time()).replace(tzinfo=ATAL_TIMEZONE)
+        window_end = datetime.datetime.combine(
+            end_date + datetime.timedelta(days=1), datetime.time()
+        ).replace(tzinfo=ATAL_TIMEZONE)
+
+        query = f"(StartDate lt {window_end.isoformat()}) and (EndDate ge {window_start.isoformat()})"
+        lookups = {"start_date__lt": window_end, "end_date__gte": window_start}
+        if rooms is not None:
+            rooms_query = " or ".join(f"RoomId eq {room}" for room in rooms)
+            query = f"({rooms_query}) and {query}"
+            lookups["room_id__in"] = rooms
+
+        if live:
+            indisponibilites = self.read_reservations_room_details(request, filters=query)
+        else:
+            indisponibilites = self.get_room_loan_lines(request, query, **lookups)
+        return availability.loan_intervals(indisponibilites)
+
+    def availability_response(self, points, flags, slot, output_format, last_day):
+        """
+        réponse des sources de données de disponibilité, avec le premier jour de la page suivante
+        """
+        return {
+            "data": availability.format_availability(points, flags, slot, output_format),
+            "next_date_from": (last_day + datetime.timedelta(days=1)).isoformat(),
+        }
+
+    def parse_room_filter(self, filters):
+        """
+        ids des salles d'un filtre OData de la forme « RoomId eq 1 or RoomId eq 2 »
+        :return: liste d'ids, None si le filtre a une autre forme
+        """
+        if not re.fullmatch(r"\(?\s*RoomId eq \d+(\s+or\s+RoomId eq \d+)*\s*\)?", filters.strip()):
+            return None
+        return [int(room) for room in re.findall(r"RoomId eq (\d+)", filters)]
+
+    def get_room_loan_lines(self, request, filters, **lookups):
+        """
+        lignes de location de salles, lues dans le miroir local s'il est assez récent, sinon dans ATAL
+        :param filters: filtre OData pour l'appel à ATAL
+        :param lookups: filtre équivalent sur AtalRoomLoanLine
+        """
+        if self.loans_mirror_is_fresh():
+            return [line.data for line in self.room_loan_lines.filter(**lookups)]
+        return self.read_reservations_room_details(request, filters=filters)
+
+    def occupancy_cache_keys(self, rooms):
+        """
+        clés de cache des tableaux d'occupation des salles ; elles contiennent la génération
+        de toutes les salles et celle de chaque salle, changées par invalidate_occupancy().
+        Elles sont lues avant les locations : un tableau calculé pendant une invalidation
+        est rangé sous une clé déjà abandonnée.
+        """
+        prefix = f"passerelle-imio-ia-tech-{self.pk}-occupancy"
+        rooms = [int(room) for room in rooms]
+        generation_keys = [f"{prefix}-generation"] + [f"{prefix}-generation-{room}" for room in rooms]
+        generations = cache.get_many(generation_keys)
+        missing = [key for key in generation_keys if key not in generations]
+        if missing:
+            for key in missing:
+                cache.add(key, time.time_ns(), None)
+            # une autre requête a pu créer la même génération entre-temps
+            generations.update(cache.get_many(missing))
+        generation = generations.get(f"{prefix}-generation")
+        return {
+            room: f"{prefix}-{generation}-{room}-{generations.get(f'{prefix}-generation-{room}')}" for room in rooms
+        }
+
+    def get_occupancy(self, request, rooms):
+        """
+        occupation cumulée des salles données sur l'année à venir, à partir des tableaux
+        d'occupation de chaque salle gardés en cache ; ceux qui manquent sont recalculés
+        à partir d'une seule lecture des locations
+        """
+        origin = datetime.date.today()
+        keys = self.occupancy_cache_keys(rooms)
+        cached = cache.get_many(keys.values())
+
+        occupancy = availability.Occupancy(origin)
+        missing = []
+        for room, key in keys.items():
+            value = cached.get(key)
+            # les tableaux d'un autre jour ne couvrent plus la bonne période
+            if value and value[0] == origin.toordinal():
+                occupancy |= availability.Occupancy.loads(value)
+            else:
+                missing.append(room)
+
+        self.atal.metrics.observe_cache("occupancy", "hit", len(keys) - len(missing))
+        self.atal.metrics.observe_cache("occupancy", "miss", len(missing))
+
+        if missing:
+            intervals = {room: [] for room in missing}
+            for interval in self.get_indisponibilities(request, missing, 0):
+                if interval.room_id in intervals:
+                    intervals[interval.room_id].append(interval)
+            computed = {}
+            for room, room_intervals in intervals.items():
+                room_occupancy = availability.Occupancy.from_intervals(origin, room_intervals)
+                occupancy |= room_occupancy
+                computed[keys[room]] = room_occupancy.dumps()
+            cache.set_many(computed, self.occupancy_cache_timeout)
+
+        return occupancy
+
+    def invalidate_occupancy(self, rooms=None):
+        """
+        oublie les tableaux d'occupation des salles données, ou de toutes les salles, en
+        changeant leur génération : un calcul en cours ne peut plus les remettre en cache
+        """
+        prefix = f"passerelle-imio-ia-tech-{self.pk}-occupancy"
+        if rooms is None:
+            cache.set(f"{prefix}-generation", time.time_ns(), None)
+        else:
+            cache.set_many({f"{prefix}-generation-{int(room)}": time.time_ns() for room in rooms}, None)
+
+    def loans_mirror_is_fresh(self):
+        """
+        le miroir est utilisable si sa dernière relecture complète est plus récente que
+        loans_mirror_max_age : les mises à jour limitées aux nouvelles lignes (après une
+        réservation) ne voient pas les locations modifiées ou supprimées dans ATAL
+        """
+        if not self.loans_mirror_max_age or not self.loans_mirror_full_synced:
+            return False
+        max_age = datetime.timedelta(minutes=self.loans_mirror_max_age)
+        return timezone.now() - self.loans_mirror_full_synced <= max_age
+
+    def sync_room_loan_lines(self, full=False):
+        """
+        met à jour le miroir local des lignes de location de salles
+        :param full: si False, seules les lignes plus récentes que la dernière connue
+                     (Id croissant dans ATAL) sont lues ; sinon tout le miroir est relu,
+                     ce qui prend aussi en compte les lignes modifiées ou supprimées
+        :return: nombre de lignes lues dans ATAL
+        """
+        with transaction.atomic():
+            # une seule mise à jour du miroir à la fois par connecteur (tâches cron et
+            # réservations) : sinon deux transactions réinsèrent les mêmes lignes. ATAL est
+            # lu une fois le verrou pris, pour qu'une relecture ne remplace pas le miroir par
+            # une image plus ancienne que celle écrite par la mise à jour précédente
+            imio_atal.objects.select_for_update().filter(pk=self.pk).first()
+            watermark = None
+            if not full:
+                watermark = self.room_loan_lines.aggregate(Max("atal_id"))["atal_id__max"]
+            if watermark is None:
+                # seules les locations à venir sont utiles aux disponibilités
+                query = f"EndDate ge {datetime.date.today().strftime('%Y-%m-%d')}"
+            else:
+                query = f"Id gt {watermark}"
+
+            synced = timezone.now()
+            lines = self.read_reservations_room_details(None, filters=query)
+
+            if watermark is None:
+                self.room_loan_lines.all().delete()
+            else:
+                self.room_loan_lines.filter(atal_id__in=[line["Id"] for line in lines]).delete()
+            AtalRoomLoanLine.objects.bulk_create(
+                [
+                    AtalRoomLoanLine(
+                        resource=self,
+                        atal_id=line["Id"],
+                        room_id=line.get("RoomId"),
+                        start_date=string_to_aware_datetime(line["StartDate"]),
+                        end_date=string_to_aware_datetime(line["EndDate"]),
+                        data=line,
+                    )
+                    for line in lines
+                ]
+            )
+            if watermark is None:
+                imio_atal.objects.filter(pk=self.pk).update(loans_mirror_synced=synced, loans_mirror_full_synced=synced)
+                self.loans_mirror_full_synced = synced
+            else:
+                imio_atal.objects.filter(pk=self.pk).update(loans_mirror_synced=synced)
+        self.loans_mirror_synced = synced
+
+        if watermark is None:
+            self.invalidate_occupancy()
+        else:
+            self.invalidate_occupancy({line["RoomId"] for line in lines if line.get("RoomId") is not None})
+        return len(lines)
+
+
+class AtalRoom(models.Model):
+    """Patrimoine louable d'une instance ATAL, rafraîchi par la tâche horaire"""
+
+    resource = models.ForeignKey(imio_atal, on_delete=models.CASCADE, related_name="rooms")
+    atal_id = models.IntegerField()
+    parent_id = models.IntegerField(null=True)
+    type = models.IntegerField(null=True)
+    # ordre renvoyé par ATAL
+    position = models.PositiveIntegerField(default=0)
+    # patrimoine tel que renvoyé par ATAL
+    data = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ["position"]
+        unique_together = ["resource", "atal_id"]
+        indexes = [
+            models.Index(fields=["resource", "parent_id"], name="atal_room_resource_parent_idx"),
+            models.Index(fields=["resource", "type"], name="atal_room_resource_type_idx"),
+        ]
+
+
+class AtalRoomLoanLine(models.Model):
+    """Copie locale d'une ligne de location de salle (/api/RoomLoans/Lines)"""
+
+    resource = models.ForeignKey(imio_atal, on_delete=models.CASCADE, related_name="room_loan_lines")
+    atal_id = models.IntegerField()
+    room_id = models.IntegerField(null=True)
+    start_date = models.DateTimeField()
+    end_date = models.DateTimeField()
+    # ligne telle que renvoyée par ATAL
+    data = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ["atal_id"]
+        unique_together = ["resource", "atal_id"]
+        indexes = [
+            models.Index(fields=["resource", "room_id", "start_date"], name="atal_loan_line_room_idx"),
+            models.Index(fields=["resource", "start_date", "end_date"], name="atal_loan_line_dates_idx"),
+        ]
+
+
+class AtalRoomHold(models.Model):
+    """Salle bloquée localement pendant l'inscription d'une réservation dans ATAL"""
+
+    resource = models.ForeignKey(imio_atal, on_delete=models.CASCADE, related_name="room_holds")
+    room_id = models.IntegerField()
+    expires = models.DateTimeField()
+
+    class Meta:
+        unique_together = ["resource", "room_id"]
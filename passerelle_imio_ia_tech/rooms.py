@@ -0,0 +1,40 @@
+class RoomHierarchy:
+    """
+    arborescence parents/enfants du patrimoine louable, construite en mémoire
+    à partir d'une seule lecture de /api/Patrimonies
+    """
+
+    def __init__(self, patrimonies):
+        """
+        :param patrimonies: liste du patrimoine louable renvoyée par ATAL
+        """
+        # tout le patrimoine louable, quel que soit son type
+        self.parents = {patrimony["Id"]: patrimony.get("ParentId") for patrimony in patrimonies}
+        # salles louables (type 1), dans l'ordre renvoyé par ATAL
+        self.rooms = [x for x in patrimonies if "Type" in x and x["Type"] == 1]
+        self.kids = {}
+        for room in self.rooms:
+            self.kids.setdefault(room.get("ParentId"), []).append(room["Id"])
+
+    def __contains__(self, patrimony_id):
+        return patrimony_id in self.parents
+
+    def parent_of(self, patrimony_id):
+        return self.parents.get(patrimony_id)
+
+    def kids_of(self, patrimony_id):
+        return self.kids.get(patrimony_id, [])
+
+    def rooms_for_indisponibilities(self, room, parent_id):
+        """
+        salles rendues indisponibles par une location de la salle donnée :
+        la salle elle-même, son parent s'il est louable et ses enfants louables
+        :param room: id de la salle
+        :param parent_id: id du parent de la salle (ParentId dans ATAL), ou None
+        :return: liste d'ids
+        """
+        rooms = [room]
+        if parent_id and parent_id in self.parents:
+            rooms.append(parent_id)
+        rooms.extend(self.kids_of(room))
+        return rooms
@@ -19,6 +19,8 @@ setup(
     ],
     install_requires=[
         "django>=3.2, <3.3",
+        # lecture en flux des grosses réponses ATAL (get-patrimonies)
+        "ijson>=3.1",
     ],
     zip_safe=False,
 )
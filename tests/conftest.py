@@ -0,0 +1,23 @@
+# Les tests du connecteur tournent dans un environnement passerelle :
+#     PASSERELLE_SETTINGS_FILE=tests/settings.py DJANGO_SETTINGS_MODULE=passerelle.settings python -m pytest tests
+# Sans passerelle, seuls les tests des modules sans dépendance sont collectés.
+import pytest
+
+try:
+    import passerelle  # noqa: F401
+except ImportError:
+    collect_ignore = ["test_client.py", "test_models.py"]
+
+
+@pytest.fixture
+def clear_state():
+    from django.core.cache import cache
+
+    from passerelle_imio_ia_tech import client
+    from passerelle_imio_ia_tech import metrics
+
+    cache.clear()
+    client.LatencyTracker._samples.clear()
+    metrics.Metrics._known_series.clear()
+    yield
+    cache.clear()
@@ -0,0 +1,2 @@
+# Réglages ajoutés à ceux de passerelle pour les tests (PASSERELLE_SETTINGS_FILE)
+INSTALLED_APPS += ("passerelle_imio_ia_tech",)  # noqa: F821
@@ -0,0 +1,135 @@
+import datetime
+import random
+
+import pytest
+
+from passerelle_imio_ia_tech import availability
+from passerelle_imio_ia_tech.availability import string_to_datetime
+
+BASE = datetime.datetime(2026, 3, 20)
+
+
+# implémentations d'origine de generate-hour-availability et generate-day-availability :
+# une comparaison par heure ou par jour et par location
+
+
+def reference_hours(indisponibilites, start_datetime, end_datetime):
+    delta = int((end_datetime - start_datetime).total_seconds() / 3600)
+    hours = [start_datetime + datetime.timedelta(hours=x) for x in range(delta + 1)]
+    free_hours = []
+    for hour in hours:
+        disabled = False
+        for x in indisponibilites:
+            if string_to_datetime(x["StartDate"]) <= hour <= string_to_datetime(x["EndDate"]):
+                disabled = True
+                break
+        free_hours.append(
+            {
+                "text": hour.strftime("%d/%m/%Y %H:%M"),
+                "id": hour.strftime("%Y-%m-%dT%H:%M"),
+                "start_date": hour.strftime("%Y-%m-%d"),
+                "end_date": hour.strftime("%Y-%m-%d"),
+                "start_time": hour.strftime("%H:%M"),
+                "end_time": hour.strftime("%H:59"),
+                "disabled": disabled,
+            }
+        )
+    return free_hours
+
+
+def reference_days(indisponibilites, start_date, end_date):
+    days = [start_date + datetime.timedelta(days=x) for x in range((end_date - start_date).days + 1)]
+    free_days = []
+    for day in days:
+        disabled = True in [
+            string_to_datetime(x["StartDate"]).date() <= day <= string_to_datetime(x["EndDate"]).date()
+            for x in indisponibilites
+        ]
+        free_days.append(
+            {
+                "text": day.strftime("%d/%m/%Y"),
+                "id": day.strftime("%Y-%m-%d"),
+                "start_date": day.strftime("%Y-%m-%d"),
+                "end_date": day.strftime("%Y-%m-%d"),
+                "start_time": "00:00",
+                "end_time": "23:59",
+                "disabled": disabled,
+            }
+        )
+    return free_days
+
+
+def random_loans(rng, count, spread_days, max_minutes):
+    """
+    locations aléatoires, certaines commençant avant la période, certaines vides ou
+    inversées (fin avant début), avec ou sans fuseau horaire
+    """
+    loans = []
+    for _ in range(count):
+        start = BASE + datetime.timedelta(minutes=rng.randint(-3000, 60 * 24 * spread_days))
+        end = start + datetime.timedelta(minutes=rng.randint(-300, max_minutes))
+        suffix = rng.choice(["", "+01:00", ".000"])
+        loans.append(
+            {
+                "RoomId": rng.choice([1, 2]),
+                "StartDate": start.strftime("%Y-%m-%dT%H:%M:%S") + suffix,
+                "EndDate": end.strftime("%Y-%m-%dT%H:%M:%S") + suffix,
+            }
+        )
+    return loans
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_hour_and_day_flags_match_reference(seed):
+    rng = random.Random(seed)
+    loans = random_loans(rng, rng.randint(0, 20), 40, 3000)
+    start_datetime = BASE + datetime.timedelta(days=rng.randint(0, 5))
+    end_datetime = BASE.replace(hour=23) + datetime.timedelta(days=rng.randint(5, 40))
+    intervals = availability.loan_intervals(loans)
+
+    hours = availability.hours_between(start_datetime, end_datetime)
+    assert availability.format_availability(
+        hours, availability.hour_flags(intervals, hours), availability.hour_slot
+    ) == reference_hours(loans, start_datetime, end_datetime)
+
+    days = availability.days_between(start_datetime.date(), end_datetime.date())
+    assert availability.format_availability(
+        days, availability.day_flags(intervals, days), availability.day_slot
+    ) == reference_days(loans, start_datetime.date(), end_datetime.date())
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_occupancy_matches_reference(seed):
+    rng = random.Random(seed)
+    loans = random_loans(rng, rng.randint(0, 20), 400, 30000)
+    # tableaux calculés par salle puis combinés, après un aller-retour par le cache
+    occupancy = availability.Occupancy.from_intervals(
+        BASE.date(), availability.loan_intervals([loan for loan in loans if loan["RoomId"] == 1])
+    ) | availability.Occupancy.from_intervals(
+        BASE.date(), availability.loan_intervals([loan for loan in loans if loan["RoomId"] == 2])
+    )
+    occupancy = availability.Occupancy.loads(occupancy.dumps())
+
+    first = rng.randint(0, 300)
+    start_datetime = BASE + datetime.timedelta(days=first)
+    end_datetime = BASE.replace(hour=23) + datetime.timedelta(days=rng.randint(first, min(first + 60, 365)))
+
+    hours = availability.hours_between(start_datetime, end_datetime)
+    assert occupancy.hour_flags(start_datetime, len(hours)) == [
+        hour["disabled"] for hour in reference_hours(loans, start_datetime, end_datetime)
+    ]
+    days = availability.days_between(start_datetime.date(), end_datetime.date())
+    assert occupancy.day_flags(start_datetime.date(), len(days)) == [
+        day["disabled"] for day in reference_days(loans, start_datetime.date(), end_datetime.date())
+    ]
+
+
+def test_occupancy_outside_period():
+    occupancy = availability.Occupancy.from_intervals(BASE.date(), [])
+    assert occupancy.hour_flags(BASE.replace(hour=23) + datetime.timedelta(days=366), 2) is None
+
+
+def test_hour_flags_bounds_are_blocked():
+    loans = [{"StartDate": "2026-03-20T10:00:00", "EndDate": "2026-03-20T12:00:00"}]
+    hours = availability.hours_between(BASE.replace(hour=9), BASE.replace(hour=13))
+    assert availability.hour_flags(availability.loan_intervals(loans), hours) == [False, True, True, True, False]
@@ -0,0 +1,396 @@
+import io
+import json
+import logging
+import time
+from unittest import mock
+
+import pytest
+import requests
+import urllib3
+from django.core.cache import cache
+from django.test import RequestFactory
+from passerelle.utils.api import endpoint
+from passerelle.utils.jsonresponse import APIError
+
+from passerelle_imio_ia_tech import client
+from passerelle_imio_ia_tech.client import AtalClient
+from passerelle_imio_ia_tech.client import Invocation
+from passerelle_imio_ia_tech.client import instrumented_endpoint
+from passerelle_imio_ia_tech.client import invocation_scope
+from passerelle_imio_ia_tech.client import route_template
+
+
+# cache et mesures de latence vidés entre les tests
+pytestmark = pytest.mark.usefixtures("clear_state")
+
+
+def make_response(data=None, status=200, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(data).encode()
+    response.headers.update(headers or {})
+    return response
+
+
+class FakeSession:
+    """session HTTP de passerelle : renvoie, dans l'ordre, les réponses ou erreurs données"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def mount(self, prefix, adapter):
+        pass
+
+    def request(self, method, url, params=None, **kwargs):
+        # copie : le client réutilise le même dict d'une page à l'autre
+        self.calls.append((method, url, dict(kwargs, params=dict(params or {}))))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+class Connector:
+    """attributs du connecteur imio_atal utilisés par AtalClient"""
+
+    pk = 1
+    slug = "atal"
+    base_url = "https://atal.example.com"
+    api_key = "secret"
+    verify_cert = True
+    http_pool_size = 10
+    odata_page_size = 2
+    requests_timeout = 25
+    requests_max_retries = {}
+    adaptive_timeout_samples = 200
+    adaptive_timeout_min_samples = 20
+    adaptive_timeout_factor = 3
+    adaptive_timeout_floor = 3
+    adaptive_timeout_ceiling = 60
+    circuit_breaker_threshold = 3
+    circuit_breaker_reset_timeout = 30
+
+    def __init__(self, *responses):
+        self.requests = FakeSession(*responses)
+        self.logger = logging.getLogger("passerelle_imio_ia_tech.tests")
+
+
+def test_request_headers_and_verify():
+    connector = Connector(make_response([]))
+    AtalClient(connector).get("/api/Thematics", params={"$top": 5})
+    method, url, kwargs = connector.requests.calls[0]
+    assert (method, url) == ("GET", "https://atal.example.com/api/Thematics")
+    assert kwargs["headers"]["X-API-Key"] == "secret"
+    assert kwargs["headers"]["accept"] == "application/json"
+    assert kwargs["params"] == {"$top": 5}
+    assert kwargs["verify"] is True
+
+
+def test_request_errors():
+    connector = Connector(
+        make_response({"Message": "not found"}, status=404),
+        requests.ConnectionError("connection refused"),
+    )
+    atal = AtalClient(connector)
+    with pytest.raises(APIError) as excinfo:
+        atal.get("/api/Patrimonies/1")
+    assert excinfo.value.data == {"Message": "not found"}
+    with pytest.raises(APIError, match="connection refused"):
+        atal.get("/api/Patrimonies/1")
+
+    connector.requests.responses = [make_response()]
+    connector.requests.responses[0]._content = b"<html>"
+    with pytest.raises(APIError, match="bad JSON"):
+        atal.get("/api/Patrimonies/1")
+
+
+def test_get_memoized_within_invocation():
+    connector = Connector(make_response([1]), make_response([2]))
+    atal = AtalClient(connector)
+    invocation = Invocation()
+    with invocation_scope(invocation):
+        assert atal.get("/api/Thematics") == [1]
+        assert atal.get("/api/Thematics") == [1]
+        # une écriture oublie les GET mémorisés
+        connector.requests.responses.insert(0, make_response({"Id": 3}))
+        atal.post("/api/RoomLoans", json={})
+        assert atal.get("/api/Thematics") == [2]
+    assert (invocation.calls, invocation.memo_hits) == (3, 1)
+
+
+def test_cached_get_revalidates_with_etag():
+    connector = Connector(make_response([1], headers={"ETag": '"v1"'}), make_response(status=304))
+    atal = AtalClient(connector)
+    assert atal.get("/api/Thematics", cache_timeout=60) == [1]
+    assert atal.get("/api/Thematics", cache_timeout=60) == [1]
+    assert len(connector.requests.calls) == 1
+
+    with mock.patch("passerelle_imio_ia_tech.client.time.time", return_value=time.time() + 120):
+        assert atal.get("/api/Thematics", cache_timeout=60) == [1]
+    assert connector.requests.calls[1][2]["headers"]["If-None-Match"] == '"v1"'
+
+
+def test_iter_items_reads_pages_lazily():
+    connector = Connector(make_response([{"Id": 1}, {"Id": 2}]), make_response([{"Id": 3}]))
+    atal = AtalClient(connector)
+    items = atal.iter_items("/api/RoomLoans/Lines", params={"$filter": "Id gt 0"})
+    assert next(items) == {"Id": 1}
+    assert len(connector.requests.calls) == 1
+    assert [item["Id"] for item in items] == [2, 3]
+    assert [call[2]["params"]["$skip"] for call in connector.requests.calls] == [0, 2]
+    assert connector.requests.calls[0][2]["params"]["$orderby"] == "Id"
+
+
+def test_iter_items_pages_are_not_memoized():
+    connector = Connector(make_response([{"Id": 1}]), make_response([{"Id": 1}]))
+    atal = AtalClient(connector)
+    with invocation_scope(Invocation()) as invocation:
+        list(atal.iter_items("/api/RoomLoans/Lines"))
+        list(atal.iter_items("/api/RoomLoans/Lines"))
+        assert invocation.memo == {}
+    assert len(connector.requests.calls) == 2
+
+
+def test_iter_items_follows_next_link():
+    connector = Connector(
+        make_response({"value": [{"Id": 1}], "@odata.nextLink": "https://atal.example.com/api/Items?page=2"}),
+        make_response({"value": [{"Id": 2}]}),
+    )
+    assert [item["Id"] for item in AtalClient(connector).iter_items("/api/Items")] == [1, 2]
+    assert connector.requests.calls[1][1] == "https://atal.example.com/api/Items?page=2"
+
+
+def test_route_template():
+    assert route_template("GET", "/api/Patrimonies/2732") == "GET /api/Patrimonies/{id}"
+    assert route_template("GET", "/api/Patrimonies", {"$expand": "Address"}) == "GET /api/Patrimonies $expand"
+    assert route_template("POST", "/api/RoomLoans?x=1") == "POST /api/RoomLoans"
+
+
+def test_breaker_opens_after_consecutive_failures():
+    connector = Connector(*[make_response(status=500)] * 3)
+    atal = AtalClient(connector)
+    for _ in range(3):
+        with pytest.raises(APIError):
+            atal.get("/api/Thematics")
+
+    # ouvert : échec immédiat, sans appel à ATAL
+    with pytest.raises(APIError) as excinfo:
+        atal.get("/api/Thematics")
+    assert excinfo.value.data["circuit_breaker"] == "open"
+    assert len(connector.requests.calls) == 3
+
+
+def test_breaker_half_open_probe():
+    connector = Connector(*[requests.Timeout("timeout")] * 4, make_response([1]), make_response([2]))
+    atal = AtalClient(connector)
+    for _ in range(3):
+        with pytest.raises(APIError):
+            atal.get("/api/Thematics")
+
+    later = time.time() + 31
+    with mock.patch("passerelle_imio_ia_tech.client.time.time", return_value=later):
+        # l'essai échoue : le disjoncteur se rouvre
+        with pytest.raises(APIError, match="timeout"):
+            atal.get("/api/Thematics")
+        with pytest.raises(APIError) as excinfo:
+            atal.get("/api/Thematics")
+        assert excinfo.value.data["circuit_breaker"] == "open"
+
+    with mock.patch("passerelle_imio_ia_tech.client.time.time", return_value=later + 31):
+        # l'essai réussit : le disjoncteur se referme
+        assert atal.get("/api/Thematics") == [1]
+        assert atal.get("/api/Thematics") == [2]
+    assert len(connector.requests.calls) == 6
+
+
+def test_breaker_success_resets_failures():
+    connector = Connector(make_response(status=500), make_response(status=500), make_response([]))
+    connector.requests.responses += [make_response(status=500)] * 2 + [make_response([])]
+    atal = AtalClient(connector)
+    for expected in (APIError, APIError, None, APIError, APIError, None):
+        if expected:
+            with pytest.raises(expected):
+                atal.get("/api/Thematics")
+        else:
+            atal.get("/api/Thematics")
+    assert len(connector.requests.calls) == 6
+
+
+def test_adaptive_timeout():
+    connector = Connector()
+    atal = AtalClient(connector)
+    route = "GET /api/Thematics"
+    for _ in range(19):
+        atal.latency.record(route, 2)
+    # pas assez de mesures
+    assert atal.latency.timeout(route) == 25
+    atal.latency.record(route, 4)
+    # 99e centile multiplié par adaptive_timeout_factor
+    assert atal.latency.timeout(route) == 12
+
+    for _ in range(200):
+        atal.latency.record(route, 0.1)
+    assert atal.latency.timeout(route) == 3
+    for _ in range(200):
+        atal.latency.record(route, 30)
+    assert atal.latency.timeout(route) == 60
+
+
+def test_adaptive_timeout_only_for_reads():
+    connector = Connector(make_response([]), make_response({"Id": 1}))
+    atal = AtalClient(connector)
+    for _ in range(20):
+        atal.latency.record("GET /api/Thematics", 0.5)
+        atal.latency.record("POST /api/RoomLoans", 0.5)
+    atal.get("/api/Thematics")
+    atal.post("/api/RoomLoans", json={})
+    assert [call[2]["timeout"] for call in connector.requests.calls] == [3, 25]
+
+
+def test_timeout_is_recorded():
+    connector = Connector(requests.Timeout("timeout"))
+    atal = AtalClient(connector)
+    with pytest.raises(APIError):
+        atal.get("/api/Thematics")
+    assert len(client.LatencyTracker._samples[(1, "GET /api/Thematics")]) == 1
+
+
+class BrokenBody(io.BytesIO):
+    """corps de réponse dont la connexion est coupée une fois les données reçues lues"""
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if not data:
+            raise urllib3.exceptions.ProtocolError("Connection broken")
+        return data
+
+
+def test_iter_json_fields():
+    response = make_response([{"Id": 1, "Name": "Salle", "Address": {}}, {"Id": 2, "Name": "Hall"}])
+    response.raw = io.BytesIO(response._content)
+    connector = Connector(response)
+    items = AtalClient(connector).iter_json("/api/Patrimonies", fields=["Id", "Name"])
+    assert list(items) == [{"Id": 1, "Name": "Salle"}, {"Id": 2, "Name": "Hall"}]
+    assert connector.requests.calls[0][2]["stream"] is True
+
+
+def test_iter_json_connection_broken_mid_body():
+    response = make_response()
+    response.raw = BrokenBody(b'[{"Id": 1}, {"Id": 2}, {"Id"')
+    connector = Connector(response)
+    atal = AtalClient(connector)
+    with pytest.raises(APIError, match="Connection broken"):
+        list(atal.iter_json("/api/Patrimonies"))
+    assert cache.get(atal.breaker.failures_key) == 1
+    assert ("GET /api/Patrimonies", "error") in atal.metrics.series()
+
+
+class AccountedConnector(Connector):
+    call_accounting_headers = True
+
+    @instrumented_endpoint
+    @endpoint(name="thematics")
+    def thematics(self, request):
+        return {"data": AtalClient(self).get("/api/Thematics")}
+
+    @instrumented_endpoint
+    @endpoint(name="thematics-list")
+    def thematics_list(self, request):
+        return AtalClient(self).get("/api/Thematics")
+
+    @instrumented_endpoint
+    @endpoint(name="nothing")
+    def nothing(self, request):
+        return None
+
+
+@pytest.mark.parametrize(
+    "name, data",
+    [
+        ("thematics", {"err": 0, "data": [1]}),
+        ("thematics_list", {"err": 0, "data": [1]}),
+        ("nothing", {"err": 0, "data": None}),
+    ],
+)
+def test_accounting_headers(name, data):
+    connector = AccountedConnector(make_response([1]))
+    response = getattr(connector, name)(RequestFactory().get("/"))
+    assert json.loads(response.content) == data
+    assert response["X-Atal-Calls"] == ("0" if name == "nothing" else "1")
+    assert response["Server-Timing"].startswith("atal;dur=")
+
+
+def test_cached_get_waits_for_shared_response():
+    connector = Connector()
+    atal = AtalClient(connector)
+    key = atal.cache_key("/api/Thematics", None)
+    # un autre worker interroge ATAL
+    cache.add(f"{key}-fetching", True)
+
+    def other_worker_stores(delay):
+        cache.set(key, {"data": [7], "etag": None, "last_modified": None, "fetched": time.time()})
+
+    with mock.patch("passerelle_imio_ia_tech.client.time.sleep", side_effect=other_worker_stores) as sleep:
+        assert atal.get("/api/Thematics", cache_timeout=60) == [7]
+    assert sleep.call_count == 1
+    assert connector.requests.calls == []
+
+
+def test_cached_get_uncacheable_response(caplog):
+    connector = Connector(make_response([1]), make_response([2]))
+    atal = AtalClient(connector)
+    key = atal.cache_key("/api/Thematics", None)
+    cache_set = cache.set
+
+    def set_without_entry(cache_key, *args, **kwargs):
+        # memcached ignore les valeurs de plus de 1 Mo
+        if cache_key != key:
+            cache_set(cache_key, *args, **kwargs)
+
+    with mock.patch.object(cache, "set", set_without_entry):
+        assert atal.get("/api/Thematics", cache_timeout=60) == [1]
+        assert "too large to be cached" in caplog.text
+
+        # un autre worker interroge ATAL : inutile d'attendre une réponse qui ne sera pas gardée
+        cache.add(f"{key}-fetching", True)
+        with mock.patch("passerelle_imio_ia_tech.client.time.sleep") as sleep:
+            assert atal.get("/api/Thematics", cache_timeout=60) == [2]
+        assert sleep.call_count == 0
+
+
+def test_cached_get_serves_stale_while_refreshing():
+    connector = Connector(make_response([1]), make_response([2]))
+    atal = AtalClient(connector)
+    key = atal.cache_key("/api/Thematics", None)
+    assert atal.get("/api/Thematics", cache_timeout=60, stale_timeout=600) == [1]
+
+    later = time.time() + 120
+    with mock.patch("passerelle_imio_ia_tech.client.time.time", return_value=later):
+        with mock.patch("passerelle_imio_ia_tech.client.threading.Thread") as thread:
+            # réponse périmée servie tout de suite, un seul rafraîchissement lancé
+            assert atal.get("/api/Thematics", cache_timeout=60, stale_timeout=600) == [1]
+            assert atal.get("/api/Thematics", cache_timeout=60, stale_timeout=600) == [1]
+        assert thread.call_count == 1
+        assert len(connector.requests.calls) == 1
+        thread.call_args.kwargs["target"]()
+        assert cache.get(f"{key}-fetching") is None
+        assert atal.get("/api/Thematics", cache_timeout=60, stale_timeout=600) == [2]
+    assert len(connector.requests.calls) == 2
+
+
+def test_metrics_render():
+    connector = Connector(make_response([]), make_response(status=500))
+    atal = AtalClient(connector)
+    atal.get("/api/Patrimonies/12")
+    with pytest.raises(APIError):
+        atal.get("/api/Patrimonies/13")
+    atal.metrics.observe_cache("occupancy", "hit", 3)
+
+    lines = atal.metrics.render(atal.breaker).splitlines()
+    labels = 'connector="atal",route="GET /api/Patrimonies/{id}"'
+    assert f'atal_request_duration_seconds_bucket{{{labels},status="200",le="+Inf"}} 1' in lines
+    assert f'atal_request_duration_seconds_count{{{labels},status="500"}} 1' in lines
+    assert 'atal_cache_requests_total{connector="atal",cache="occupancy",result="hit"} 3' in lines
+    assert 'atal_circuit_breaker_state{connector="atal"} 0' in lines
+    assert 'atal_circuit_breaker_failures{connector="atal"} 1' in lines
@@ -0,0 +1,341 @@
+import datetime
+import json
+import threading
+import time
+from unittest import mock
+
+import pytest
+from django.test import RequestFactory
+from django.utils import timezone
+from passerelle.utils.jsonresponse import APIError
+
+from passerelle_imio_ia_tech import availability
+from passerelle_imio_ia_tech.models import AtalRoomHold
+from passerelle_imio_ia_tech.models import imio_atal
+
+PATRIMONIES = [
+    {"Id": 1, "Name": "Bâtiment", "Type": 2, "ParentId": None},
+    {"Id": 10, "Name": "Salle A", "Type": 1, "ParentId": 1},
+    {"Id": 11, "Name": "Salle B", "Type": 1, "ParentId": 1},
+    {"Id": 12, "Name": "Sous-salle A", "Type": 1, "ParentId": 10},
+]
+
+
+def loan(loan_id, room, start, end):
+    return {"Id": loan_id, "RoomId": room, "StartDate": start, "EndDate": end}
+
+
+def mirror_ids(connector):
+    return list(connector.room_loan_lines.values_list("atal_id", flat=True))
+
+
+@pytest.fixture
+def connector(db, clear_state):
+    return imio_atal.objects.create(
+        slug="atal",
+        title="ATAL",
+        description="ATAL",
+        base_url="https://atal.example.com",
+        api_key="secret",
+    )
+
+
+def test_get_rooms_syncs_once(connector):
+    with mock.patch.object(connector.atal, "get", return_value=PATRIMONIES) as atal_get:
+        assert [room.atal_id for room in connector.get_rooms()] == [1, 10, 11, 12]
+        assert [room.atal_id for room in connector.get_rooms()] == [1, 10, 11, 12]
+    assert atal_get.call_count == 1
+
+
+def test_sync_rooms_if_empty_after_concurrent_sync(connector):
+    with mock.patch.object(connector.atal, "get", return_value=PATRIMONIES) as atal_get:
+        connector.sync_rooms()
+        # une autre requête a synchronisé pendant l'attente du verrou : rien à faire
+        assert connector.sync_rooms(if_empty=True) == 4
+    assert atal_get.call_count == 1
+
+
+def test_sync_rooms_replaces_rooms(connector):
+    with mock.patch.object(connector.atal, "get", return_value=PATRIMONIES):
+        connector.sync_rooms()
+    with mock.patch.object(connector.atal, "get", return_value=PATRIMONIES[:2]):
+        assert connector.sync_rooms() == 2
+    assert [room.atal_id for room in connector.rooms.all()] == [1, 10]
+
+
+def test_full_sync_replaces_mirror(connector):
+    lines = [
+        loan(1, 10, "2030-01-01T10:00:00", "2030-01-01T11:59:00"),
+        loan(2, 11, "2030-01-02T10:00:00", "2030-01-02T11:59:00"),
+    ]
+    with mock.patch.object(imio_atal, "read_reservations_room_details", return_value=lines) as read:
+        assert connector.sync_room_loan_lines(full=True) == 2
+    assert read.call_args.kwargs["filters"].startswith("EndDate ge ")
+    assert mirror_ids(connector) == [1, 2]
+
+    # location 1 annulée dans ATAL
+    with mock.patch.object(imio_atal, "read_reservations_room_details", return_value=lines[1:]):
+        connector.sync_room_loan_lines(full=True)
+    assert mirror_ids(connector) == [2]
+
+
+def test_incremental_sync_does_not_refresh_mirror(connector):
+    line = loan(1, 10, "2030-01-01T10:00:00", "2030-01-01T11:59:00")
+    with mock.patch.object(imio_atal, "read_reservations_room_details", return_value=[line]):
+        connector.sync_room_loan_lines(full=True)
+    assert connector.loans_mirror_is_fresh()
+
+    imio_atal.objects.filter(pk=connector.pk).update(
+        loans_mirror_full_synced=timezone.now() - datetime.timedelta(minutes=20)
+    )
+    connector.refresh_from_db()
+    new_line = loan(2, 10, "2030-01-03T10:00:00", "2030-01-03T11:59:00")
+    with mock.patch.object(imio_atal, "read_reservations_room_details", return_value=[new_line]) as read:
+        connector.sync_room_loan_lines()
+    assert read.call_args.kwargs["filters"] == "Id gt 1"
+    assert mirror_ids(connector) == [1, 2]
+    # les lignes modifiées ou supprimées ne sont vues que par une relecture complète
+    assert not connector.loans_mirror_is_fresh()
+    with mock.patch.object(imio_atal, "read_reservations_room_details", return_value=[]) as read:
+        connector.get_room_loan_lines(None, "RoomId eq 10", room_id__in=[10])
+    assert read.call_count == 1
+
+
+def test_conflict_check_reads_atal(connector):
+    with mock.patch.object(imio_atal, "read_reservations_room_details", return_value=[]):
+        connector.sync_room_loan_lines(full=True)
+    assert connector.loans_mirror_is_fresh()
+
+    # location déplacée dans ATAL depuis la dernière relecture du miroir
+    moved = [loan(1, 10, "2030-01-01T10:00:00", "2030-01-01T11:59:00")]
+    with mock.patch.object(imio_atal, "read_reservations_room_details", return_value=moved) as read:
+        with pytest.raises(APIError) as excinfo:
+            connector.check_room_conflicts(None, [10, 12], [("2030-01-01T11:59", "2030-01-01T12:59")])
+        assert excinfo.value.data == {"start": "2030-01-01T11:59", "end": "2030-01-01T12:59", "room": 10}
+        connector.check_room_conflicts(None, [10, 12], [("2030-01-01T12:00", "2030-01-01T12:59")])
+    assert "(RoomId eq 10 or RoomId eq 12) and " in read.call_args.kwargs["filters"]
+
+
+def test_sync_reads_atal_under_lock(connector):
+    events = []
+    select_for_update = type(imio_atal.objects).select_for_update
+
+    def lock(manager):
+        events.append("lock")
+        return select_for_update(manager)
+
+    def read(self, request, filters):
+        events.append("read")
+        return []
+
+    with mock.patch.object(type(imio_atal.objects), "select_for_update", lock):
+        with mock.patch.object(imio_atal, "read_reservations_room_details", read):
+            connector.sync_room_loan_lines(full=True)
+    assert events == ["lock", "read"]
+
+
+def test_dates_dispo_reads_mirror(connector):
+    lines = [
+        loan(1, 10, "2020-01-01T10:00:00", "2030-01-01T11:59:00"),
+        loan(2, 10, "2030-01-02T10:00:00", "2030-01-02T11:59:00"),
+        loan(3, 11, "2030-01-03T10:00:00", "2030-01-03T11:59:00"),
+        loan(4, 12, "2030-01-04T10:00:00", "2030-01-04T11:59:00"),
+    ]
+    with mock.patch.object(imio_atal, "read_reservations_room_details", return_value=lines):
+        connector.sync_room_loan_lines(full=True)
+
+    with mock.patch.object(imio_atal, "read_reservations_room_details", return_value=[]) as read:
+        assert connector.read_dates_dispo(None, filters="RoomId eq 10")["data"] == lines[1:2]
+        assert connector.read_dates_dispo(None, filters="(RoomId eq 10 or RoomId eq 11)")["data"] == lines[1:3]
+        assert connector.read_dates_dispo(None)["data"] == lines[1:]
+        assert read.call_count == 0
+
+        # filtre sans équivalent dans le miroir
+        connector.read_dates_dispo(None, filters="LoanId eq 5")
+    assert read.call_args.kwargs["filters"].startswith("(LoanId eq 5) and StartDate ge ")
+
+
+def test_occupancy_cached_per_room(connector):
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    lines = [loan(1, 10, f"{tomorrow}T10:00:00", f"{tomorrow}T11:59:00")]
+    with mock.patch.object(imio_atal, "get_indisponibilities", return_value=availability.loan_intervals(lines)) as read:
+        connector.get_occupancy(None, [10, 11])
+        occupancy = connector.get_occupancy(None, [10, 11])
+        assert occupancy.hour_flags(datetime.datetime.combine(tomorrow, datetime.time(9)), 4) == [
+            False,
+            True,
+            True,
+            False,
+        ]
+        assert read.call_count == 1
+
+        connector.invalidate_occupancy([11])
+        connector.get_occupancy(None, [10, 11])
+        assert read.call_args.args[1:] == ([11], 0)
+
+        connector.invalidate_occupancy()
+        connector.get_occupancy(None, [10, 11])
+        assert read.call_args.args[1:] == ([10, 11], 0)
+        assert read.call_count == 3
+
+
+def test_occupancy_invalidated_during_fetch(connector):
+    def read(self, request, rooms, start):
+        # réservation enregistrée pendant la lecture des locations
+        connector.invalidate_occupancy([10])
+        return []
+
+    with mock.patch.object(imio_atal, "get_indisponibilities", read):
+        connector.get_occupancy(None, [10, 11])
+    with mock.patch.object(imio_atal, "get_indisponibilities", return_value=[]) as read:
+        connector.get_occupancy(None, [10, 11])
+    # le tableau calculé avant la réservation n'est pas resservi
+    assert read.call_args.args[1:] == ([10], 0)
+
+
+def test_availability_matrix_all_rooms(connector):
+    with mock.patch.object(connector.atal, "get", return_value=PATRIMONIES):
+        connector.sync_rooms()
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    lines = [
+        loan(1, 12, f"{tomorrow}T10:00:00", f"{tomorrow}T11:59:00"),
+        # salle hors du patrimoine louable
+        loan(2, 99, f"{tomorrow}T10:00:00", f"{tomorrow}T11:59:00"),
+    ]
+    with mock.patch.object(imio_atal, "read_reservations_room_details", return_value=lines) as read:
+        matrix = connector.generate_availability_matrix(None, rooms="all", start=0, end=2, granularity="day")
+    # pas de filtre RoomId pour toutes les salles : les locations sont triées localement
+    assert "RoomId" not in read.call_args.kwargs["filters"]
+    assert [slot["id"] for slot in matrix["slots"]] == [
+        (tomorrow + datetime.timedelta(days=day)).isoformat() for day in (-1, 0, 1)
+    ]
+    assert matrix["data"] == [
+        {"id": 10, "disabled": [False, True, False]},
+        {"id": 11, "disabled": [False, False, False]},
+        {"id": 12, "disabled": [False, True, False]},
+    ]
+
+    with mock.patch.object(imio_atal, "read_reservations_room_details", return_value=lines) as read:
+        matrix = connector.generate_availability_matrix(None, rooms="11", start=1, end=1, granularity="day")
+    assert read.call_args.kwargs["filters"].startswith("(RoomId eq 1 or RoomId eq 11) and ")
+    assert matrix["data"] == [{"id": 11, "disabled": [False]}]
+
+
+@pytest.mark.parametrize(
+    "start, end, granularity",
+    [(-1, 2, "hour"), (3, 2, "hour"), (0, 31, "hour"), (0, 366, "day"), (0, 1, "week")],
+)
+def test_availability_matrix_bounds(connector, start, end, granularity):
+    with pytest.raises(APIError):
+        connector.generate_availability_matrix(None, start=start, end=end, granularity=granularity)
+
+
+def test_fan_out_bounded_per_connector(connector):
+    connector.max_concurrent_calls = 2
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def call():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+        return True
+
+    # deux appels d'endpoint simultanés partagent les places du connecteur
+    threads = [threading.Thread(target=connector.fan_out, args=([call] * 4,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(peak) == 8
+    assert max(peak) == 2
+
+
+def test_fan_out_nested_runs_inline(connector):
+    connector.max_concurrent_calls = 1
+    results = connector.fan_out([lambda: connector.fan_out([lambda: 1, lambda: 2])] * 2)
+    assert results == [([(1, None), (2, None)], None)] * 2
+
+
+def test_verify_cert_by_default(connector):
+    assert connector.verify_cert is True
+
+
+def test_hold_rooms_blocks_concurrent_booking(connector):
+    with connector.hold_rooms([10, 1, 12]):
+        # réservation simultanée d'une salle liée
+        with pytest.raises(APIError, match="déjà en cours"):
+            with connector.hold_rooms([12, 10]):
+                pass
+        assert connector.room_holds.count() == 3
+    assert connector.room_holds.count() == 0
+    with connector.hold_rooms([12, 10]):
+        assert connector.room_holds.count() == 2
+
+
+def test_hold_rooms_ignores_expired_holds(connector):
+    AtalRoomHold.objects.create(resource=connector, room_id=10, expires=timezone.now() - datetime.timedelta(seconds=1))
+    with connector.hold_rooms([10]):
+        assert connector.room_holds.count() == 1
+    assert connector.room_holds.count() == 0
+
+
+def test_conflict_bounds_are_inclusive(connector):
+    lines = [loan(1, 10, "2030-01-01T10:00:00", "2030-01-01T11:59:00")]
+    with mock.patch.object(imio_atal, "read_reservations_room_details", return_value=lines):
+        for start, end in [("2030-01-01T09:00", "2030-01-01T10:00"), ("2030-01-01T10:30", "2030-01-01T10:45")]:
+            with pytest.raises(APIError):
+                connector.check_room_conflicts(None, [10], [("2030-01-02T10:00", "2030-01-02T11:00"), (start, end)])
+        connector.check_room_conflicts(None, [10], [("2030-01-01T09:00", "2030-01-01T09:59")])
+
+
+def test_bookings_partial_failure(connector):
+    with mock.patch.object(connector.atal, "get", return_value=PATRIMONIES):
+        connector.sync_rooms()
+    body = {
+        "booking_dates": [
+            {"start_date": "2030-01-01", "start_time": "10:00", "end_date": "2030-01-01", "end_time": "10:59"},
+            # plage contiguë : fusionnée avec la précédente
+            {"start_date": "2030-01-01", "start_time": "11:00", "end_date": "2030-01-01", "end_time": "11:59"},
+            {"start_date": "2030-01-02", "start_time": "10:00", "end_date": "2030-01-02", "end_time": "10:59"},
+        ]
+    }
+    request = RequestFactory().post("/", data=json.dumps(body), content_type="application/json")
+
+    held = []
+
+    def read(self, request, filters):
+        held.append(connector.room_holds.count())
+        return []
+
+    def post_room_loan(self, dates, room, *args):
+        if dates[0][0].startswith("2030-01-02"):
+            raise APIError("ATAL Error: 500 Server Error")
+        return {"Id": 1, "dates": dates}
+
+    with mock.patch.object(imio_atal, "read_reservations_room_details", autospec=True, side_effect=read) as read:
+        with mock.patch.object(imio_atal, "post_room_loan", post_room_loan):
+            with pytest.raises(APIError) as excinfo:
+                connector.bookings_room(request, 10)
+    assert excinfo.value.data == {
+        "bookings": [{"Id": 1, "dates": [("2030-01-01T10:00", "2030-01-01T11:59")]}],
+        "errors": [
+            {
+                "start_date": "2030-01-02",
+                "start_time": "10:00",
+                "end_date": "2030-01-02",
+                "end_time": "10:59",
+                "err_desc": "ATAL Error: 500 Server Error",
+            }
+        ],
+    }
+    # vérification des conflits pour la salle, son parent et son enfant, puis mise à jour du miroir
+    assert "(RoomId eq 10 or RoomId eq 1 or RoomId eq 12) and " in read.call_args_list[0].kwargs["filters"]
+    assert read.call_args_list[1].kwargs["filters"].startswith("EndDate ge ")
+    # salles bloquées pendant la vérification et l'inscription, puis libérées
+    assert held == [3, 3]
+    assert connector.room_holds.count() == 0